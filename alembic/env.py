@@ -25,6 +25,12 @@ if config.config_file_name is not None:
 # Set target_metadata to your Base's metadata
 target_metadata = Base.metadata
 
+# Tables managed outside the models (see backend/app/database.py), never autogenerated
+EXCLUDED_TABLES = {"schema_version"}
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name in EXCLUDED_TABLES)
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -32,6 +38,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -45,7 +52,8 @@ def run_migrations_online() -> None:
     with connectable.connect() as connection:
         context.configure(
             connection=connection, 
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            include_object=include_object
         )
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,80 @@
+"""
+宽松跨域(CORS)中间件
+
+本API对所有来源开放并允许携带认证信息，不需要Starlette CORSMiddleware逐项匹配策略的逻辑。
+这里直接在ASGI层处理：
+1. 预检请求(OPTIONS)直接返回204和预先编码好的响应头，不进入路由
+2. 其他请求在响应开始时追加同一组预先编码好的响应头
+
+因为允许携带认证信息，浏览器不接受 Access-Control-Allow-Origin: *，
+所以与原先的CORSMiddleware一样回显请求的Origin，并带上 Vary: Origin。
+"""
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+MAX_AGE = b"600"
+
+# 普通响应追加的固定头
+_SIMPLE_HEADERS = (
+    (b"access-control-allow-credentials", b"true"),
+    (b"access-control-expose-headers", b"*"),
+)
+
+# 预检响应的固定头
+_PREFLIGHT_HEADERS = (
+    (b"access-control-allow-methods", ALLOW_METHODS),
+    (b"access-control-max-age", MAX_AGE),
+    (b"access-control-allow-credentials", b"true"),
+    (b"vary", b"Origin, Access-Control-Request-Method, Access-Control-Request-Headers"),
+)
+
+
+class PermissiveCORSMiddleware:
+    """允许任意来源、方法和请求头的CORS中间件"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        request_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if origin is not None and scope["method"] == "OPTIONS" and request_method is not None:
+            headers = [(b"access-control-allow-origin", origin), *_PREFLIGHT_HEADERS]
+            if request_headers is not None:
+                headers.append((b"access-control-allow-headers", request_headers))
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # 响应随Origin不同而不同，非跨域请求也带上 Vary: Origin，避免缓存串用；
+        # 路由已设置Vary时与CORSMiddleware一样追加到原有值后面
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                if origin is not None:
+                    headers.append((b"access-control-allow-origin", origin))
+                    headers.extend(_SIMPLE_HEADERS)
+                for i, (name, value) in enumerate(headers):
+                    if name.lower() == b"vary":
+                        headers[i] = (name, value + b", Origin")
+                        break
+                else:
+                    headers.append((b"vary", b"Origin"))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
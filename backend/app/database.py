@@ -24,6 +24,10 @@
 最后更新: 2025年1月
 """
 
+import hashlib
+from sqlalchemy import Column, MetaData, String, Table, select
+from sqlalchemy.schema import CreateIndex, CreateTable
+
 # 导入数据库基础配置
 from .models.base import Base
 from .config.database_config import engine, SessionLocal, get_db
@@ -42,3 +46,43 @@ from .models.schemas import SkillReport, JobMatch        # 分析报告和匹配
 # LearningPath -> LearningTask (一对多)
 # User -> SkillReport (一对多)
 # User -> JobMatch (一对多)
+
+# 记录当前表结构哈希的单行表，单独放在一份元数据里，不参与Base的建表和哈希计算；
+# alembic/env.py的include_object会跳过它，自动生成迁移时不会产生drop_table
+_schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("v", String(64), nullable=False)
+)
+
+def schema_hash() -> str:
+    """按所有模型的建表和建索引DDL计算表结构哈希，模型有任何改动哈希都会变化"""
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(engine)))
+        # 按DDL文本排序：未命名索引的name为None，不能直接比较
+        statements.extend(sorted(str(CreateIndex(index).compile(engine)) for index in table.indexes))
+    ddl = "\n".join(statements)
+    return hashlib.sha256(ddl.encode()).hexdigest()
+
+def init_db() -> bool:
+    """
+    按需创建数据库表结构
+    
+    只有记录的表结构哈希与当前模型不一致时才调用create_all，
+    否则一次查询即可跳过对每张表的存在性检查。
+    注意：手工删除的表不会被自动重建，此时需清空schema_version表。
+    
+    Returns:
+        bool: 本次是否执行了create_all
+    """
+    current = schema_hash()
+    with engine.begin() as conn:
+        _schema_version.create(conn, checkfirst=True)
+        if conn.execute(select(_schema_version.c.v)).scalar() == current:
+            return False
+        
+        Base.metadata.create_all(bind=conn)
+        conn.execute(_schema_version.delete())
+        conn.execute(_schema_version.insert().values(v=current))
+    return True
@@ -97,20 +97,19 @@ class GroqClient:
     async def check_quota(self, user_id: int) -> bool:
         """检查用户免费额度"""
         try:
-            from .usage_tracker import UsageTracker
-            tracker = UsageTracker()
+            from .usage_tracker import usage_tracker
             
-            daily_usage = await tracker.get_daily_usage(user_id, "groq")
-            minute_usage = await tracker.get_minute_usage(user_id, "groq")
+            # 每分钟限制按滑动窗口计算，避免分钟边界前后各用满一次额度
+            result = await usage_tracker.check_limit(user_id, "groq")
             
             # 检查每日限制
-            if daily_usage >= self.daily_limit:
-                logger.warning(f"用户 {user_id} Groq每日额度已用完: {daily_usage}/{self.daily_limit}")
+            if not result["daily_ok"]:
+                logger.warning(f"用户 {user_id} Groq每日额度已用完: 限额{self.daily_limit}")
                 return False
             
             # 检查每分钟限制
-            if minute_usage >= self.rate_limit:
-                logger.warning(f"用户 {user_id} Groq每分钟额度已用完: {minute_usage}/{self.rate_limit}")
+            if not result["minute_ok"]:
+                logger.warning(f"用户 {user_id} Groq每分钟额度已用完: 限额{self.rate_limit}")
                 return False
             
             return True
@@ -122,11 +121,9 @@ class GroqClient:
     async def get_usage_stats(self, user_id: int) -> Dict[str, Any]:
         """获取使用统计"""
         try:
-            from .usage_tracker import UsageTracker
-            tracker = UsageTracker()
+            from .usage_tracker import usage_tracker
             
-            daily_usage = await tracker.get_daily_usage(user_id, "groq")
-            minute_usage = await tracker.get_minute_usage(user_id, "groq")
+            daily_usage, minute_usage = await usage_tracker.get_usage_pair(user_id, "groq")
             
             return {
                 "daily_used": daily_usage,
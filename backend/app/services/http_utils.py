@@ -0,0 +1,67 @@
+"""
+HTTP请求工具
+
+为LeetCode GraphQL、Ollama等外部服务提供统一的JSON POST请求，
+在网络错误、超时和5xx响应时按指数退避重试
+"""
+
+import aiohttp
+import asyncio
+from typing import Dict, Any, Optional
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+class UpstreamStatusError(Exception):
+    """上游服务返回非200状态码，或200响应的响应体不是合法JSON"""
+    def __init__(self, status: int, text: str):
+        self.status = status
+        self.text = text
+        super().__init__(f"{status} - {text}")
+
+async def post_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    payload: Dict[str, Any],
+    *,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 30,
+    retries: int = 2
+) -> Any:
+    """发送JSON POST请求并解析响应
+
+    网络错误、超时和5xx响应最多重试retries次，间隔0.1s、0.2s、0.4s...；
+    最后一次仍失败时抛出原异常，非200响应或响应体无法解析为JSON时抛出UpstreamStatusError。
+    """
+    body = orjson.dumps(payload)
+    request_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    for attempt in range(retries + 1):
+        try:
+            async with session.post(
+                url,
+                data=body,
+                headers=headers or JSON_HEADERS,
+                timeout=request_timeout
+            ) as response:
+                if response.status == 200:
+                    raw = await response.read()
+                    try:
+                        return orjson.loads(raw)
+                    except orjson.JSONDecodeError:
+                        # 网关错误页、空响应等，与其他上游错误一样交给调用方处理，不重试
+                        raise UpstreamStatusError(response.status, raw.decode(errors="replace"))
+
+                error = UpstreamStatusError(response.status, await response.text())
+                if response.status < 500 or attempt == retries:
+                    raise error
+                logger.warning(f"请求 {url} 返回 {response.status}，准备重试 ({attempt + 1}/{retries})")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"请求 {url} 失败: {e!r}，准备重试 ({attempt + 1}/{retries})")
+
+        await asyncio.sleep(0.1 * (2 ** attempt))
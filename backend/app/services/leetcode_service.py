@@ -1,6 +1,6 @@
 import aiohttp
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 import json
 import time
 import hashlib
@@ -8,40 +8,232 @@ from datetime import datetime, timedelta
 from dataclasses import dataclass
 import logging
 import re
-from functools import wraps
+import math
+import bisect
+import weakref
+from functools import wraps, lru_cache
 import redis
 from collections import defaultdict
 
+from .http_utils import post_json, UpstreamStatusError
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 缓存配置
 CACHE_EXPIRY = 3600  # 1小时
+CACHE_STALE_TTL = 600  # 过期后仍可返回旧值的时间窗口（10分钟）
+GRAPHQL_CACHE_TTL = 300  # GraphQL查询结果缓存5分钟
+GRAPHQL_CACHE_SIZE = 512  # 每类查询最多缓存的用户数
+CONTEST_TIMEOUT = 5  # 竞赛信息为次要数据，超时时间较短
+
+# 学习里程碑及分级阈值
+_MILESTONES = (50, 100, 200, 300, 500, 1000)
+_ERROR_RATE_THRESHOLDS = (20, 40, 60)  # 错误率不超过阈值即达到对应等级
+_ERROR_LEVELS = ("优秀", "良好", "中等", "需要改进")
+_LEARNING_PHASE_THRESHOLDS = (50, 200, 500)
+_LEARNING_PHASES = ("基础学习", "技能提升", "深度练习", "专业精进")
+
+# 纯函数分级：浮点输入先取整到整数分桶再查缓存。阈值均为整数，
+# 对 >=/< 比较向下取整、对 <= 比较向上取整，结果与直接比较一致
+@lru_cache(maxsize=128)
+def _proficiency_level(score_bucket: int) -> str:
+    if score_bucket >= 90:
+        return "专家"
+    elif score_bucket >= 75:
+        return "高级"
+    elif score_bucket >= 60:
+        return "中级"
+    elif score_bucket >= 40:
+        return "初级"
+    else:
+        return "入门"
+
+@lru_cache(maxsize=128)
+def _error_level(rate_bucket: int) -> str:
+    return _ERROR_LEVELS[bisect.bisect_left(_ERROR_RATE_THRESHOLDS, rate_bucket)]
+
+@lru_cache(maxsize=128)
+def _learning_phase(total_solved: int) -> str:
+    return _LEARNING_PHASES[bisect.bisect_right(_LEARNING_PHASE_THRESHOLDS, total_solved)]
+
+@lru_cache(maxsize=128)
+def _next_steps(score_bucket: int) -> Tuple[str, ...]:
+    if score_bucket < 40:
+        return ("加强基础练习", "每日坚持刷题", "学习基本算法")
+    elif score_bucket < 70:
+        return ("提升解题效率", "学习中级算法", "参加编程竞赛")
+    else:
+        return ("挑战困难题目", "深入学习高级算法", "准备技术面试")
+
+# 解题策略特征
+_STRATEGY_CHARACTERISTICS = {
+    "基础建设型": ("注重基础", "循序渐进", "稳扎稳打"),
+    "稳步推进型": ("均衡发展", "持续进步", "目标明确"),
+    "全面发展型": ("广度优先", "挑战困难", "追求卓越")
+}
+_DEFAULT_CHARACTERISTICS = ("需要更多数据",)
+
+# GraphQL查询：技能分析只需要提交统计和语言分布
+_ANALYSIS_QUERY = """
+query userSkillStats($username: String!) {
+    matchedUser(username: $username) {
+        username
+        profile {
+            ranking
+            reputation
+        }
+        submitStats {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+            totalSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+        languageProblemCount {
+            languageName
+            problemsSolved
+        }
+    }
+}
+"""
+
+# GraphQL查询：完整用户档案，用于综合分析页面
+_PROFILE_QUERY = """
+query userPublicProfile($username: String!) {
+    matchedUser(username: $username) {
+        username
+        profile {
+            realName
+            avatar
+            location
+            company
+            school
+            website
+            github
+            linkedin
+            twitter
+            aboutMe
+            skillTags
+            ranking
+            reputation
+            createdAt
+            lastModified
+        }
+        contributions {
+            points
+        }
+        badges {
+            id
+            displayName
+            icon
+            creationDate
+        }
+        submitStats {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+            totalSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+        languageProblemCount {
+            languageName
+            problemsSolved
+        }
+    }
+}
+"""
+
+_CONTEST_QUERY = """
+query userContestRanking($username: String!) {
+    userContestRanking(username: $username) {
+        attendedContestsCount
+        rating
+        globalRanking
+        topPercentage
+        badge {
+            name
+        }
+    }
+}
+"""
+
+# 用户名及LeetCode主页URL格式
+_USERNAME_RE = re.compile(r'^[a-zA-Z0-9_-]+$')
+_URL_PATTERNS = (
+    re.compile(r'leetcode\.(?:com|cn)/(?:u|profile)/([a-zA-Z0-9_-]+)'),
+    re.compile(r'leetcode\.(?:com|cn)/([a-zA-Z0-9_-]+)(?:/)?$')
+)
 RATE_LIMIT_WINDOW = 60  # 1分钟
 RATE_LIMIT_REQUESTS = 10  # 每分钟最多10个请求
 
 # 在生产环境中应该使用Redis
 class SimpleCache:
-    def __init__(self):
+    def __init__(self, maxsize: Optional[int] = None):
         self.cache = {}
-        self.timestamps = {}
+        self.maxsize = maxsize
+    
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """获取缓存条目，包含数据及新鲜/过期时间"""
+        entry = self.cache.get(key)
+        if entry is not None and time.time() >= entry["stale_until"]:
+            del self.cache[key]
+            return None
+        return entry
     
     def get(self, key: str) -> Optional[Any]:
-        if key in self.cache:
-            if time.time() - self.timestamps[key] < CACHE_EXPIRY:
-                return self.cache[key]
-            else:
-                del self.cache[key]
-                del self.timestamps[key]
+        entry = self.get_entry(key)
+        if entry is not None and time.time() < entry["fresh_until"]:
+            return entry["data"]
         return None
     
-    def set(self, key: str, value: Any):
-        self.cache[key] = value
-        self.timestamps[key] = time.time()
+    def set(self, key: str, value: Any, expiry: int = CACHE_EXPIRY, stale_ttl: int = 0):
+        # 超出容量时淘汰最早写入的条目
+        if self.maxsize and key not in self.cache and len(self.cache) >= self.maxsize:
+            del self.cache[next(iter(self.cache))]
+        now = time.time()
+        self.cache[key] = {
+            "data": value,
+            "fresh_until": now + expiry,
+            "stale_until": now + expiry + stale_ttl
+        }
 
 # 全局缓存实例
 cache = SimpleCache()
+user_info_cache = SimpleCache(maxsize=GRAPHQL_CACHE_SIZE)
+contest_info_cache = SimpleCache(maxsize=GRAPHQL_CACHE_SIZE)
+
+# 按缓存键的请求锁，使同一用户的并发查询合并为一次网络请求
+_fetch_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+async def _cached_fetch(store: SimpleCache, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """带TTL缓存的查询，空结果不缓存"""
+    result = store.get(key)
+    if result is not None:
+        return result
+    
+    lock = _fetch_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        result = store.get(key)
+        if result is None:
+            result = await fetch()
+            if result:
+                store.set(key, result, GRAPHQL_CACHE_TTL)
+    return result
+
+# 正在进行的后台刷新任务，按缓存键去重
+_refresh_tasks: Dict[str, asyncio.Task] = {}
 
 # 速率限制器
 class RateLimiter:
@@ -78,23 +270,44 @@ def rate_limit(func):
         return await func(self, *args, **kwargs)
     return wrapper
 
-def cache_result(expiry: int = CACHE_EXPIRY):
-    """缓存结果装饰器"""
+def cache_result(expiry: int = CACHE_EXPIRY, stale_ttl: int = CACHE_STALE_TTL):
+    """缓存结果装饰器（stale-while-revalidate）
+    
+    新鲜期内直接返回缓存；过期后的stale_ttl窗口内先返回旧值，
+    同时在后台刷新（同一缓存键只会有一个刷新任务）；超出窗口则同步刷新。
+    """
     def decorator(func):
+        async def refresh(self, cache_key, *args, **kwargs):
+            try:
+                result = await func(self, *args, **kwargs)
+                cache.set(cache_key, result, expiry, stale_ttl)
+                logger.info(f"Cache refreshed for {cache_key}")
+            except Exception as e:
+                logger.warning(f"后台刷新缓存失败 {cache_key}: {e}")
+        
         @wraps(func)
         async def wrapper(self, *args, **kwargs):
             # 生成缓存键
             cache_key = f"{func.__name__}:{hashlib.md5(str(args).encode()).hexdigest()}"
             
             # 尝试从缓存获取
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                logger.info(f"Cache hit for {cache_key}")
-                return cached_result
+            entry = cache.get_entry(cache_key)
+            if entry is not None:
+                if time.time() < entry["fresh_until"]:
+                    logger.info(f"Cache hit for {cache_key}")
+                    return entry["data"]
+                
+                # 已过期但仍在容忍窗口内：返回旧值并在后台刷新
+                if cache_key not in _refresh_tasks:
+                    task = asyncio.create_task(refresh(self, cache_key, *args, **kwargs))
+                    _refresh_tasks[cache_key] = task
+                    task.add_done_callback(lambda _: _refresh_tasks.pop(cache_key, None))
+                logger.info(f"Stale cache hit for {cache_key}")
+                return entry["data"]
             
             # 执行函数并缓存结果
             result = await func(self, *args, **kwargs)
-            cache.set(cache_key, result)
+            cache.set(cache_key, result, expiry, stale_ttl)
             logger.info(f"Cache set for {cache_key}")
             
             return result
@@ -110,6 +323,22 @@ class LeetCodeAnalysisResult:
     learning_recommendations: List[Dict[str, Any]]
     competitive_ranking: Dict[str, Any]
     problem_solving_patterns: Dict[str, Any]
+
+@dataclass(slots=True, frozen=True)
+class DifficultyCounts:
+    """各难度通过题数
+
+    total_solved为acSubmissionNum全部条目count之和（沿用各处原有的求和口径），
+    total仅为Easy/Medium/Hard三者之和。
+    """
+    easy: int = 0
+    medium: int = 0
+    hard: int = 0
+    total_solved: int = 0
+    
+    @property
+    def total(self) -> int:
+        return self.easy + self.medium + self.hard
     
 class LeetCodeServiceException(Exception):
     """LeetCode服务异常"""
@@ -120,6 +349,11 @@ class LeetCodeServiceException(Exception):
         super().__init__(self.message)
 
 class LeetCodeService:
+    __slots__ = ("base_url", "graphql_url", "headers", "skill_weights", "skill_categories")
+    
+    # 共享的HTTP会话：服务按请求实例化，会话在实例间复用以保持连接池和DNS缓存
+    _session: Optional[aiohttp.ClientSession] = None
+    
     def __init__(self):
         self.base_url = "https://leetcode.com/api"
         self.graphql_url = "https://leetcode.com/graphql"
@@ -170,8 +404,25 @@ class LeetCodeService:
             "Trie": "字典树"
         }
     
+    @classmethod
+    def _get_session(cls) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（惰性创建）"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return cls._session
+    
+    @classmethod
+    async def aclose(cls):
+        """关闭共享的HTTP会话"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+    
     @rate_limit
-    @cache_result(expiry=1800)  # 30分钟缓存
+    @cache_result(expiry=1800, stale_ttl=600)  # 30分钟缓存，过期后10分钟内后台刷新
     async def get_comprehensive_analysis(self, username_or_url: str) -> LeetCodeAnalysisResult:
         """获取全面的LeetCode分析"""
         try:
@@ -184,33 +435,46 @@ class LeetCodeService:
             
             # 并行获取用户数据
             user_info, contest_info, submission_stats = await asyncio.gather(
-                self._get_user_info(username),
+                self._get_full_profile(username),
                 self._get_contest_info(username),
                 self._get_submission_statistics(username),
                 return_exceptions=True
             )
             
-            # 处理异常
+            # 处理异常：保留服务异常原有的错误码，其余异常统一包装
+            if isinstance(user_info, LeetCodeServiceException):
+                raise user_info
             if isinstance(user_info, Exception):
                 raise LeetCodeServiceException(
                     f"获取用户信息失败: {str(user_info)}",
                     error_code="USER_INFO_ERROR"
                 )
             
+            # 竞赛和提交统计为次要数据，失败时降级为空
+            if isinstance(contest_info, Exception):
+                logger.warning(f"获取竞赛信息失败: {contest_info}")
+                contest_info = {}
+            if isinstance(submission_stats, Exception):
+                logger.warning(f"获取提交统计失败: {submission_stats}")
+                submission_stats = {}
+            
             if not user_info:
                 raise LeetCodeServiceException(
                     f"用户'{username}'不存在",
                     error_code="USER_NOT_FOUND"
                 )
             
+            # 各难度通过题数只汇总一次，供下面所有分析共用
+            counts = self._summarize(user_info.get("submitStats", {}).get("acSubmissionNum", []))
+            
             # 生成综合分析
             analysis_result = LeetCodeAnalysisResult(
                 user_profile=await self._build_user_profile(user_info, contest_info),
-                skill_analysis=await self._analyze_skills_advanced(user_info),
-                performance_metrics=await self._calculate_performance_metrics(user_info, submission_stats),
-                learning_recommendations=await self._generate_learning_recommendations(user_info),
+                skill_analysis=await self._analyze_skills_advanced(user_info, counts),
+                performance_metrics=await self._calculate_performance_metrics(user_info, submission_stats, counts),
+                learning_recommendations=await self._generate_learning_recommendations(counts),
                 competitive_ranking=await self._analyze_competitive_ranking(contest_info),
-                problem_solving_patterns=await self._analyze_problem_solving_patterns(user_info)
+                problem_solving_patterns=await self._analyze_problem_solving_patterns(user_info, counts)
             )
             
             return analysis_result
@@ -259,7 +523,7 @@ class LeetCodeService:
         
         return profile
     
-    async def _analyze_skills_advanced(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_skills_advanced(self, user_info: Dict[str, Any], counts: DifficultyCounts) -> Dict[str, Any]:
         """高级技能分析"""
         skills = {
             "programming_languages": {},
@@ -307,23 +571,21 @@ class LeetCodeService:
                 }
         
         # 分析数据结构掌握程度
-        skills["data_structures"] = await self._analyze_data_structures(user_info)
+        skills["data_structures"] = await self._analyze_data_structures(counts.total_solved)
         
         # 分析问题解决能力
-        skills["problem_solving"] = await self._analyze_problem_solving_ability(user_info)
+        skills["problem_solving"] = await self._analyze_problem_solving_ability(user_info, counts)
         
         # 生成整体评估
         skills["overall_assessment"] = await self._generate_overall_assessment(skills)
         
         return skills
     
-    async def _analyze_data_structures(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_data_structures(self, total_solved: int) -> Dict[str, Any]:
         """分析数据结构掌握程度"""
         data_structures = {}
         
         # 基于解题数量推断数据结构使用
-        total_solved = sum(stat.get("count", 0) for stat in user_info.get("submitStats", {}).get("acSubmissionNum", []))
-        
         if total_solved > 0:
             # 基础数据结构推断
             structure_thresholds = {
@@ -349,15 +611,14 @@ class LeetCodeService:
         
         return data_structures
     
-    async def _analyze_problem_solving_ability(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_problem_solving_ability(self, user_info: Dict[str, Any], counts: DifficultyCounts) -> Dict[str, Any]:
         """分析问题解决能力"""
         problem_solving = {}
         
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
         total_stats = user_info.get("submitStats", {}).get("totalSubmissionNum", [])
         
         # 计算整体准确率
-        total_accepted = sum(stat.get("count", 0) for stat in submit_stats)
+        total_accepted = counts.total_solved
         total_submissions = sum(stat.get("submissions", 0) for stat in total_stats)
         
         if total_submissions > 0:
@@ -371,21 +632,21 @@ class LeetCodeService:
             }
         
         # 分析解题一致性
-        consistency_score = self._calculate_consistency_score(submit_stats)
+        consistency_score = self._calculate_consistency_score(counts)
         problem_solving["consistency"] = {
             "score": consistency_score,
             "level": self._get_proficiency_level(consistency_score)
         }
         
         # 分析解题效率
-        efficiency_score = self._calculate_efficiency_score(user_info)
+        efficiency_score = self._calculate_efficiency_score(user_info, counts)
         problem_solving["efficiency"] = {
             "score": efficiency_score,
             "level": self._get_proficiency_level(efficiency_score)
         }
         
         # 分析难度进阶能力
-        progression_score = self._calculate_progression_score(submit_stats)
+        progression_score = self._calculate_progression_score(counts)
         problem_solving["progression"] = {
             "score": progression_score,
             "level": self._get_proficiency_level(progression_score)
@@ -393,26 +654,26 @@ class LeetCodeService:
         
         return problem_solving
     
-    async def _calculate_performance_metrics(self, user_info: Dict[str, Any], submission_stats: Any) -> Dict[str, Any]:
+    async def _calculate_performance_metrics(self, user_info: Dict[str, Any], submission_stats: Any, counts: DifficultyCounts) -> Dict[str, Any]:
         """计算性能指标"""
         metrics = {}
         
         # 基础统计
         submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
-        total_solved = sum(stat.get("count", 0) for stat in submit_stats)
+        total_solved = counts.total_solved
         
         metrics["basic_stats"] = {
             "total_problems_solved": total_solved,
-            "easy_solved": next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Easy"), 0),
-            "medium_solved": next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Medium"), 0),
-            "hard_solved": next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Hard"), 0)
+            "easy_solved": counts.easy,
+            "medium_solved": counts.medium,
+            "hard_solved": counts.hard
         }
         
         # 计算难度分布
         if total_solved > 0:
-            easy_pct = (metrics["basic_stats"]["easy_solved"] / total_solved) * 100
-            medium_pct = (metrics["basic_stats"]["medium_solved"] / total_solved) * 100
-            hard_pct = (metrics["basic_stats"]["hard_solved"] / total_solved) * 100
+            easy_pct = (counts.easy / total_solved) * 100
+            medium_pct = (counts.medium / total_solved) * 100
+            hard_pct = (counts.hard / total_solved) * 100
             
             metrics["difficulty_distribution"] = {
                 "easy_percentage": easy_pct,
@@ -429,17 +690,16 @@ class LeetCodeService:
         }
         
         # 计算学习曲线
-        learning_curve = self._calculate_learning_curve(user_info)
+        learning_curve = self._calculate_learning_curve(total_solved)
         metrics["learning_curve"] = learning_curve
         
         return metrics
     
-    async def _generate_learning_recommendations(self, user_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def _generate_learning_recommendations(self, counts: DifficultyCounts) -> List[Dict[str, Any]]:
         """生成学习建议"""
         recommendations = []
         
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
-        total_solved = sum(stat.get("count", 0) for stat in submit_stats)
+        total_solved = counts.total_solved
         
         # 基于当前水平生成建议
         if total_solved < 50:
@@ -506,7 +766,7 @@ class LeetCodeService:
             ])
         
         # 基于弱点生成针对性建议
-        weak_areas = self._identify_weak_areas(submit_stats)
+        weak_areas = self._identify_weak_areas(counts)
         for area in weak_areas:
             recommendations.append({
                 "type": "improvement",
@@ -536,7 +796,7 @@ class LeetCodeService:
             "performance_level": self._get_contest_performance_level(ranking_data.get("rating", 0))
         }
     
-    async def _analyze_problem_solving_patterns(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_problem_solving_patterns(self, user_info: Dict[str, Any], counts: DifficultyCounts) -> Dict[str, Any]:
         """分析解题模式"""
         patterns = {}
         
@@ -544,29 +804,30 @@ class LeetCodeService:
         patterns["time_distribution"] = self._analyze_time_patterns(user_info)
         
         # 分析解题策略
-        patterns["solving_strategy"] = self._analyze_solving_strategy(user_info)
+        patterns["solving_strategy"] = self._analyze_solving_strategy(counts.total_solved)
         
         # 分析错误模式
-        patterns["error_patterns"] = self._analyze_error_patterns(user_info)
+        patterns["error_patterns"] = self._analyze_error_patterns(user_info, counts)
         
         # 分析学习路径
-        patterns["learning_path"] = self._analyze_learning_path(user_info)
+        patterns["learning_path"] = self._analyze_learning_path(counts)
         
         return patterns
     
     # 辅助方法
+    def _summarize(self, submit_stats: List[Dict[str, Any]]) -> DifficultyCounts:
+        """汇总各难度通过题数"""
+        by_difficulty = {stat.get("difficulty"): stat.get("count", 0) for stat in reversed(submit_stats)}
+        return DifficultyCounts(
+            easy=by_difficulty.get("Easy", 0),
+            medium=by_difficulty.get("Medium", 0),
+            hard=by_difficulty.get("Hard", 0),
+            total_solved=sum(stat.get("count", 0) for stat in submit_stats)
+        )
+    
     def _get_proficiency_level(self, score: float) -> str:
         """获取熟练度等级"""
-        if score >= 90:
-            return "专家"
-        elif score >= 75:
-            return "高级"
-        elif score >= 60:
-            return "中级"
-        elif score >= 40:
-            return "初级"
-        else:
-            return "入门"
+        return _proficiency_level(math.floor(score))
     
     def _get_accuracy_level(self, accuracy: float) -> str:
         """获取准确率等级"""
@@ -581,18 +842,10 @@ class LeetCodeService:
         else:
             return "需要大幅改进"
     
-    def _calculate_consistency_score(self, submit_stats: List[Dict[str, Any]]) -> float:
+    def _calculate_consistency_score(self, summary: DifficultyCounts) -> float:
         """计算一致性分数"""
-        if not submit_stats:
-            return 0.0
-        
         # 基于各难度题目的均衡性计算一致性
-        difficulties = ["Easy", "Medium", "Hard"]
-        counts = []
-        
-        for difficulty in difficulties:
-            count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == difficulty), 0)
-            counts.append(count)
+        counts = [summary.easy, summary.medium, summary.hard]
         
         if sum(counts) == 0:
             return 0.0
@@ -610,15 +863,14 @@ class LeetCodeService:
         consistency_score = max(0, 100 - cv * 50)
         return min(100, consistency_score)
     
-    def _calculate_efficiency_score(self, user_info: Dict[str, Any]) -> float:
+    def _calculate_efficiency_score(self, user_info: Dict[str, Any], counts: DifficultyCounts) -> float:
         """计算效率分数"""
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
         total_stats = user_info.get("submitStats", {}).get("totalSubmissionNum", [])
         
-        if not submit_stats or not total_stats:
+        if not counts.total_solved or not total_stats:
             return 0.0
         
-        total_accepted = sum(stat.get("count", 0) for stat in submit_stats)
+        total_accepted = counts.total_solved
         total_submissions = sum(stat.get("submissions", 0) for stat in total_stats)
         
         if total_submissions == 0:
@@ -627,21 +879,14 @@ class LeetCodeService:
         efficiency = (total_accepted / total_submissions) * 100
         return min(100, efficiency)
     
-    def _calculate_progression_score(self, submit_stats: List[Dict[str, Any]]) -> float:
+    def _calculate_progression_score(self, counts: DifficultyCounts) -> float:
         """计算进阶能力分数"""
-        if not submit_stats:
-            return 0.0
-        
-        easy_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Easy"), 0)
-        medium_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Medium"), 0)
-        hard_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Hard"), 0)
-        
-        total_count = easy_count + medium_count + hard_count
+        total_count = counts.total
         if total_count == 0:
             return 0.0
         
         # 基于难度分布计算进阶分数
-        progression_score = (easy_count * 1 + medium_count * 3 + hard_count * 6) / total_count
+        progression_score = (counts.easy * 1 + counts.medium * 3 + counts.hard * 6) / total_count
         return min(100, progression_score * 10)
     
     def _calculate_balance_score(self, easy_pct: float, medium_pct: float, hard_pct: float) -> float:
@@ -672,14 +917,11 @@ class LeetCodeService:
         intensity = min(100, total_weighted_score / 10)
         return intensity
     
-    def _calculate_learning_curve(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    def _calculate_learning_curve(self, total_solved: int) -> Dict[str, Any]:
         """计算学习曲线"""
         # 这里可以根据用户的提交历史分析学习曲线
         # 由于API限制，这里提供一个简化的实现
         
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
-        total_solved = sum(stat.get("count", 0) for stat in submit_stats)
-        
         # 估算学习阶段
         if total_solved < 30:
             stage = "初学者"
@@ -701,20 +943,16 @@ class LeetCodeService:
             "estimated_level": self._get_proficiency_level(progress)
         }
     
-    def _identify_weak_areas(self, submit_stats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _identify_weak_areas(self, counts: DifficultyCounts) -> List[Dict[str, Any]]:
         """识别薄弱环节"""
         weak_areas = []
         
         # 分析难度分布
-        easy_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Easy"), 0)
-        medium_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Medium"), 0)
-        hard_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Hard"), 0)
-        
-        total_count = easy_count + medium_count + hard_count
+        total_count = counts.total
         
         if total_count > 0:
             # 检查中等难度题目比例
-            medium_pct = (medium_count / total_count) * 100
+            medium_pct = (counts.medium / total_count) * 100
             if medium_pct < 40:  # 中等题目比例过低
                 weak_areas.append({
                     "name": "中等难度算法",
@@ -724,7 +962,7 @@ class LeetCodeService:
                 })
             
             # 检查困难题目比例
-            hard_pct = (hard_count / total_count) * 100
+            hard_pct = (counts.hard / total_count) * 100
             if hard_pct < 10 and total_count > 100:  # 困难题目比例过低
                 weak_areas.append({
                     "name": "高难度算法",
@@ -772,11 +1010,8 @@ class LeetCodeService:
             "consistency": "需要更多数据"
         }
     
-    def _analyze_solving_strategy(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    def _analyze_solving_strategy(self, total_solved: int) -> Dict[str, Any]:
         """分析解题策略"""
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
-        total_solved = sum(stat.get("count", 0) for stat in submit_stats)
-        
         if total_solved < 50:
             strategy = "基础建设型"
         elif total_solved < 200:
@@ -789,17 +1024,19 @@ class LeetCodeService:
             "characteristics": self._get_strategy_characteristics(strategy)
         }
     
-    def _analyze_error_patterns(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    def _analyze_error_patterns(self, user_info: Dict[str, Any], counts: DifficultyCounts) -> Dict[str, Any]:
         """分析错误模式"""
         # 基于提交统计分析错误模式
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
         total_stats = user_info.get("submitStats", {}).get("totalSubmissionNum", [])
         
         patterns = {}
         
+        ac_by_diff = {"Easy": counts.easy, "Medium": counts.medium, "Hard": counts.hard}
+        tot_by_diff = {stat.get("difficulty"): stat.get("submissions", 0) for stat in total_stats}
+        
         for difficulty in ["Easy", "Medium", "Hard"]:
-            accepted = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == difficulty), 0)
-            total = next((stat.get("submissions", 0) for stat in total_stats if stat.get("difficulty") == difficulty), 0)
+            accepted = ac_by_diff.get(difficulty, 0)
+            total = tot_by_diff.get(difficulty, 0)
             
             if total > 0:
                 error_rate = ((total - accepted) / total) * 100
@@ -810,62 +1047,41 @@ class LeetCodeService:
         
         return patterns
     
-    def _analyze_learning_path(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    def _analyze_learning_path(self, counts: DifficultyCounts) -> Dict[str, Any]:
         """分析学习路径"""
-        submit_stats = user_info.get("submitStats", {}).get("acSubmissionNum", [])
-        total_solved = sum(stat.get("count", 0) for stat in submit_stats)
+        total_solved = counts.total_solved
         
         path_analysis = {
             "current_phase": self._determine_learning_phase(total_solved),
             "next_milestone": self._get_next_milestone(total_solved),
-            "recommended_focus": self._get_recommended_focus(submit_stats)
+            "recommended_focus": self._get_recommended_focus(counts)
         }
         
         return path_analysis
     
     def _get_strategy_characteristics(self, strategy: str) -> List[str]:
         """获取策略特征"""
-        characteristics_map = {
-            "基础建设型": ["注重基础", "循序渐进", "稳扎稳打"],
-            "稳步推进型": ["均衡发展", "持续进步", "目标明确"],
-            "全面发展型": ["广度优先", "挑战困难", "追求卓越"]
-        }
-        return characteristics_map.get(strategy, ["需要更多数据"])
+        return list(_STRATEGY_CHARACTERISTICS.get(strategy, _DEFAULT_CHARACTERISTICS))
     
     def _get_error_level(self, error_rate: float) -> str:
         """获取错误等级"""
-        if error_rate <= 20:
-            return "优秀"
-        elif error_rate <= 40:
-            return "良好"
-        elif error_rate <= 60:
-            return "中等"
-        else:
-            return "需要改进"
+        return _error_level(math.ceil(error_rate))
     
     def _determine_learning_phase(self, total_solved: int) -> str:
         """确定学习阶段"""
-        if total_solved < 50:
-            return "基础学习"
-        elif total_solved < 200:
-            return "技能提升"
-        elif total_solved < 500:
-            return "深度练习"
-        else:
-            return "专业精进"
+        return _learning_phase(total_solved)
     
     def _get_next_milestone(self, total_solved: int) -> Dict[str, Any]:
         """获取下一个里程碑"""
-        milestones = [50, 100, 200, 300, 500, 1000]
-        
-        for milestone in milestones:
-            if total_solved < milestone:
-                return {
-                    "target": milestone,
-                    "remaining": milestone - total_solved,
-                    "progress": (total_solved / milestone) * 100,
-                    "estimated_time": f"{(milestone - total_solved) // 10 + 1}周"
-                }
+        idx = bisect.bisect_right(_MILESTONES, total_solved)
+        if idx < len(_MILESTONES):
+            milestone = _MILESTONES[idx]
+            return {
+                "target": milestone,
+                "remaining": milestone - total_solved,
+                "progress": (total_solved / milestone) * 100,
+                "estimated_time": f"{(milestone - total_solved) // 10 + 1}周"
+            }
         
         return {
             "target": "继续挑战",
@@ -874,20 +1090,16 @@ class LeetCodeService:
             "estimated_time": "持续进行"
         }
     
-    def _get_recommended_focus(self, submit_stats: List[Dict[str, Any]]) -> List[str]:
+    def _get_recommended_focus(self, counts: DifficultyCounts) -> List[str]:
         """获取推荐关注点"""
-        easy_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Easy"), 0)
-        medium_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Medium"), 0)
-        hard_count = next((stat.get("count", 0) for stat in submit_stats if stat.get("difficulty") == "Hard"), 0)
-        
-        total_count = easy_count + medium_count + hard_count
+        total_count = counts.total
         focus_areas = []
         
         if total_count == 0:
             focus_areas = ["开始刷题", "建立基础"]
-        elif easy_count / total_count > 0.7:
+        elif counts.easy / total_count > 0.7:
             focus_areas = ["中等难度题目", "算法深度学习"]
-        elif medium_count / total_count > 0.6:
+        elif counts.medium / total_count > 0.6:
             focus_areas = ["困难题目", "高级算法"]
         else:
             focus_areas = ["全面发展", "竞赛准备"]
@@ -896,52 +1108,40 @@ class LeetCodeService:
     
     async def _generate_overall_assessment(self, skills: Dict[str, Any]) -> Dict[str, Any]:
         """生成整体评估"""
-        # 计算综合分数
-        lang_scores = [lang_data.get("proficiency_score", 0) for lang_data in skills.get("programming_languages", {}).values()]
-        algo_scores = [algo_data.get("skill_score", 0) for algo_data in skills.get("algorithms", {}).values()]
+        # 一次性提取各项分数，供均值计算和优势/改进点识别共用
+        lang_scores = {lang: data.get("proficiency_score", 0) for lang, data in skills.get("programming_languages", {}).items()}
+        algo_scores = {algo: data.get("skill_score", 0) for algo, data in skills.get("algorithms", {}).items()}
         
-        avg_lang_score = sum(lang_scores) / len(lang_scores) if lang_scores else 0
-        avg_algo_score = sum(algo_scores) / len(algo_scores) if algo_scores else 0
+        # 计算综合分数
+        avg_lang_score = sum(lang_scores.values()) / len(lang_scores) if lang_scores else 0
+        avg_algo_score = sum(algo_scores.values()) / len(algo_scores) if algo_scores else 0
         
         overall_score = (avg_lang_score * 0.3 + avg_algo_score * 0.7)
         
         return {
             "overall_score": overall_score,
             "level": self._get_proficiency_level(overall_score),
-            "strengths": self._identify_strengths(skills),
-            "areas_for_improvement": self._identify_improvements(skills),
+            "strengths": self._identify_strengths(lang_scores, algo_scores),
+            "areas_for_improvement": self._identify_improvements(algo_scores, skills.get("problem_solving", {})),
             "next_steps": self._suggest_next_steps(overall_score)
         }
     
-    def _identify_strengths(self, skills: Dict[str, Any]) -> List[str]:
+    def _identify_strengths(self, lang_scores: Dict[str, float], algo_scores: Dict[str, float]) -> List[str]:
         """识别优势"""
-        strengths = []
-        
-        # 分析编程语言优势
-        for lang, data in skills.get("programming_languages", {}).items():
-            if data.get("proficiency_score", 0) > 70:
-                strengths.append(f"{lang}编程")
-        
-        # 分析算法优势
-        for algo, data in skills.get("algorithms", {}).items():
-            if data.get("skill_score", 0) > 75:
-                strengths.append(f"{algo.replace('_', ' ').title()}")
+        # 编程语言优势 + 算法优势
+        strengths = [f"{lang}编程" for lang, score in lang_scores.items() if score > 70]
+        strengths += [algo.replace('_', ' ').title() for algo, score in algo_scores.items() if score > 75]
         
         if not strengths:
             strengths = ["基础扎实", "学习态度积极"]
         
         return strengths
     
-    def _identify_improvements(self, skills: Dict[str, Any]) -> List[str]:
+    def _identify_improvements(self, algo_scores: Dict[str, float], problem_solving: Dict[str, Any]) -> List[str]:
         """识别改进点"""
-        improvements = []
-        
         # 分析需要改进的领域
-        for algo, data in skills.get("algorithms", {}).items():
-            if data.get("skill_score", 0) < 50:
-                improvements.append(f"{algo.replace('_', ' ').title()}")
+        improvements = [algo.replace('_', ' ').title() for algo, score in algo_scores.items() if score < 50]
         
-        problem_solving = skills.get("problem_solving", {})
         if problem_solving.get("accuracy", {}).get("rate", 0) < 70:
             improvements.append("解题准确率")
         
@@ -952,25 +1152,30 @@ class LeetCodeService:
     
     def _suggest_next_steps(self, overall_score: float) -> List[str]:
         """建议下一步"""
-        if overall_score < 40:
-            return ["加强基础练习", "每日坚持刷题", "学习基本算法"]
-        elif overall_score < 70:
-            return ["提升解题效率", "学习中级算法", "参加编程竞赛"]
-        else:
-            return ["挑战困难题目", "深入学习高级算法", "准备技术面试"]
+        return list(_next_steps(math.floor(overall_score)))
     
     # 保持原有的方法
     async def analyze_user_skills(self, username_or_url: str) -> List[Dict[str, Any]]:
         """分析LeetCode用户的技能 - 兼容性方法"""
         try:
-            analysis_result = await self.get_comprehensive_analysis(username_or_url)
+            username = self._extract_username_from_url(username_or_url)
+            if not username:
+                raise LeetCodeServiceException(
+                    "无效的用户名或URL",
+                    error_code="INVALID_INPUT"
+                )
             
-            # 转换为原有格式
-            skills = []
+            # 只需要技能数据，使用精简查询而不是完整的综合分析
+            user_info = await self._get_user_info(username)
+            counts = self._summarize(user_info.get("submitStats", {}).get("acSubmissionNum", []))
+            skill_analysis = await self._analyze_skills_advanced(user_info, counts)
             
-            # 添加编程语言技能
-            for lang, data in analysis_result.skill_analysis.get("programming_languages", {}).items():
-                skills.append({
+            # 转换为原有格式：编程语言技能 + 算法技能
+            languages = skill_analysis.get("programming_languages", {})
+            algorithms = skill_analysis.get("algorithms", {})
+            
+            skills = [
+                {
                     "skill_name": f"{lang}编程",
                     "category": "programming_language",
                     "proficiency": data.get("proficiency_score", 0),
@@ -979,11 +1184,11 @@ class LeetCodeService:
                         "problems_solved": data.get("problems_solved", 0),
                         "usage_percentage": data.get("usage_percentage", 0)
                     }
-                })
-            
-            # 添加算法技能
-            for algo, data in analysis_result.skill_analysis.get("algorithms", {}).items():
-                skills.append({
+                }
+                for lang, data in languages.items()
+            ]
+            skills += [
+                {
                     "skill_name": algo.replace("_", " ").title(),
                     "category": "algorithm",
                     "proficiency": data.get("skill_score", 0),
@@ -992,7 +1197,9 @@ class LeetCodeService:
                         "solved_count": data.get("solved_count", 0),
                         "accuracy_rate": data.get("accuracy_rate", 0)
                     }
-                })
+                }
+                for algo, data in algorithms.items()
+            ]
             
             return skills
             
@@ -1000,86 +1207,32 @@ class LeetCodeService:
             logger.error(f"LeetCode技能分析失败: {str(e)}")
             return []
     
+    @rate_limit
     async def _get_user_info(self, username: str) -> Dict[str, Any]:
+        """获取技能分析所需的用户数据（带缓存，与综合分析共用同一速率限制）"""
+        return await _cached_fetch(user_info_cache, f"user:{username}", lambda: self._fetch_user_info(username, _ANALYSIS_QUERY))
+    
+    async def _get_full_profile(self, username: str) -> Dict[str, Any]:
+        """获取完整用户档案（带缓存）"""
+        return await _cached_fetch(user_info_cache, f"profile:{username}", lambda: self._fetch_user_info(username, _PROFILE_QUERY))
+    
+    async def _fetch_user_info(self, username: str, query: str) -> Dict[str, Any]:
         """获取用户信息 - 增强版"""
-        query = """
-        query userPublicProfile($username: String!) {
-            matchedUser(username: $username) {
-                username
-                profile {
-                    realName
-                    avatar
-                    location
-                    company
-                    school
-                    website
-                    github
-                    linkedin
-                    twitter
-                    aboutMe
-                    skillTags
-                    ranking
-                    reputation
-                    createdAt
-                    lastModified
-                }
-                contributions {
-                    points
-                }
-                badges {
-                    id
-                    displayName
-                    icon
-                    creationDate
-                }
-                submitStats {
-                    acSubmissionNum {
-                        difficulty
-                        count
-                        submissions
-                    }
-                    totalSubmissionNum {
-                        difficulty
-                        count
-                        submissions
-                    }
-                }
-                languageProblemCount {
-                    languageName
-                    problemsSolved
-                }
-            }
-        }
-        """
-        
         variables = {"username": username}
         
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    self.graphql_url,
-                    headers=self.headers,
-                    json={"query": query, "variables": variables}
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        matched_user = data.get("data", {}).get("matchedUser")
-                        
-                        if not matched_user:
-                            error_msg = f"LeetCode用户'{username}'不存在"
-                            if data.get("errors"):
-                                error_msg += f" (错误: {data['errors'][0]['message']})"
-                            raise LeetCodeServiceException(error_msg, "USER_NOT_FOUND")
-                        
-                        return matched_user
-                    else:
-                        error_text = await response.text()
-                        raise LeetCodeServiceException(
-                            f"LeetCode API请求失败: {response.status}",
-                            "API_ERROR",
-                            {"status": response.status, "response": error_text}
-                        )
+            data = await post_json(
+                self._get_session(),
+                self.graphql_url,
+                {"query": query, "variables": variables},
+                headers=self.headers
+            )
+        except UpstreamStatusError as e:
+            raise LeetCodeServiceException(
+                f"LeetCode API请求失败: {e.status}",
+                "API_ERROR",
+                {"status": e.status, "response": e.text}
+            )
         except aiohttp.ClientError as e:
             raise LeetCodeServiceException(
                 f"网络请求失败: {str(e)}",
@@ -1090,39 +1243,38 @@ class LeetCodeService:
                 "请求超时，请稍后重试",
                 "TIMEOUT_ERROR"
             )
+        
+        matched_user = data.get("data", {}).get("matchedUser")
+        
+        if not matched_user:
+            error_msg = f"LeetCode用户'{username}'不存在"
+            if data.get("errors"):
+                error_msg += f" (错误: {data['errors'][0]['message']})"
+            raise LeetCodeServiceException(error_msg, "USER_NOT_FOUND")
+        
+        return matched_user
     
     async def _get_contest_info(self, username: str) -> Dict[str, Any]:
+        """获取竞赛信息（带缓存）"""
+        return await _cached_fetch(contest_info_cache, f"contest:{username}", lambda: self._fetch_contest_info(username))
+    
+    async def _fetch_contest_info(self, username: str) -> Dict[str, Any]:
         """获取竞赛信息"""
-        query = """
-        query userContestRanking($username: String!) {
-            userContestRanking(username: $username) {
-                attendedContestsCount
-                rating
-                globalRanking
-                topPercentage
-                badge {
-                    name
-                }
-            }
-        }
-        """
-        
         variables = {"username": username}
         
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    self.graphql_url,
-                    headers=self.headers,
-                    json={"query": query, "variables": variables}
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data.get("data", {})
-                    else:
-                        return {}
-        except:
+            data = await post_json(
+                self._get_session(),
+                self.graphql_url,
+                {"query": _CONTEST_QUERY, "variables": variables},
+                headers=self.headers,
+                timeout=CONTEST_TIMEOUT,
+                retries=1
+            )
+            return data.get("data", {})
+        except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamStatusError, ValueError) as e:
+            # 竞赛数据为次要信息，获取失败时跳过
+            logger.warning(f"获取竞赛信息失败，已跳过: {e}")
             return {}
     
     async def _get_submission_statistics(self, username: str) -> Dict[str, Any]:
@@ -1139,18 +1291,13 @@ class LeetCodeService:
         # 如果不是URL，直接返回
         if not url.startswith(('http://', 'https://')):
             # 验证用户名格式
-            if re.match(r'^[a-zA-Z0-9_-]+$', url):
+            if _USERNAME_RE.match(url):
                 return url
             return ""
         
         # 支持多种URL格式
-        patterns = [
-            r'leetcode\.(?:com|cn)/(?:u|profile)/([a-zA-Z0-9_-]+)',
-            r'leetcode\.(?:com|cn)/([a-zA-Z0-9_-]+)(?:/)?$'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _URL_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         
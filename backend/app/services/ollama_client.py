@@ -6,19 +6,52 @@ Ollama本地AI模型客户端
 
 import aiohttp
 import asyncio
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 import logging
 import json
+import time
+import orjson
 from datetime import datetime
 
+from .http_utils import post_json, UpstreamStatusError, JSON_HEADERS
+
 logger = logging.getLogger(__name__)
 
+MODELS_CACHE_TTL = 30  # 已安装模型列表缓存30秒
+STREAM_CONNECT_TIMEOUT = 10  # 流式请求建立连接的超时时间（秒）
+STREAM_READ_TIMEOUT = 60  # 流式请求两次数据之间的最长等待时间（秒）
+
+# 默认生成参数（只读，请求间共享）
+_DEFAULT_CHAT_OPTIONS = {"temperature": 0.7, "top_p": 0.9, "top_k": 40}
+_DEFAULT_GENERATE_OPTIONS = {"temperature": 0.7, "top_p": 0.9}
+
+def _merge_options(defaults: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """合并生成参数，没有覆盖任何默认值时直接复用默认字典"""
+    changed = {key: value for key, value in overrides.items() if key in defaults and value != defaults[key]}
+    return {**defaults, **changed} if changed else defaults
+
+# 任务类型对应的首选模型
+_MODEL_PREFERENCES = {
+    "general": "qwen2.5:7b",      # 通用任务优先中文模型
+    "code": "codellama:7b",       # 代码任务
+    "english": "llama3.1:8b",     # 英文任务
+    "chinese": "qwen2.5:7b",      # 中文任务
+}
+
 class OllamaClient:
     """Ollama本地AI模型客户端"""
     
+    __slots__ = ("base_url", "available_models")
+    
+    # 共享的HTTP会话：客户端按请求实例化，会话在实例间复用以保持长连接
+    _session: Optional[aiohttp.ClientSession] = None
+    
+    # 已安装模型列表缓存（同样在实例间共享）
+    _models_cache: List[Dict[str, Any]] = []
+    _models_cache_ts: float = 0.0
+    
     def __init__(self, host: str = "localhost", port: int = 11434):
         self.base_url = f"http://{host}:{port}"
-        self.session = None
         self.available_models = [
             "qwen2.5:7b",      # 中文优化模型
             "llama3.1:8b",     # 通用模型
@@ -27,23 +60,33 @@ class OllamaClient:
         
     async def __aenter__(self):
         """异步上下文管理器入口"""
-        self.session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=60)
-        )
+        self._get_session()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """异步上下文管理器退出"""
-        if self.session:
-            await self.session.close()
+        """异步上下文管理器退出（共享会话由应用关闭时统一释放）"""
+    
+    @classmethod
+    def _get_session(cls) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（惰性创建）"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=16, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return cls._session
+    
+    @classmethod
+    async def aclose(cls):
+        """关闭共享的HTTP会话"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
     
     async def health_check(self) -> bool:
         """健康检查"""
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-                
-            async with self.session.get(
+            async with self._get_session().get(
                 f"{self.base_url}/api/tags",
                 timeout=aiohttp.ClientTimeout(total=5)
             ) as response:
@@ -54,14 +97,17 @@ class OllamaClient:
     
     async def list_models(self) -> List[Dict[str, Any]]:
         """获取可用模型列表"""
+        cls = type(self)
+        if cls._models_cache and time.monotonic() - cls._models_cache_ts < MODELS_CACHE_TTL:
+            return cls._models_cache
+        
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-                
-            async with self.session.get(f"{self.base_url}/api/tags") as response:
+            async with self._get_session().get(f"{self.base_url}/api/tags") as response:
                 if response.status == 200:
-                    data = await response.json()
-                    return data.get("models", [])
+                    data = orjson.loads(await response.read())
+                    cls._models_cache = data.get("models", [])
+                    cls._models_cache_ts = time.monotonic()
+                    return cls._models_cache
                 else:
                     logger.error(f"获取模型列表失败: {response.status}")
                     return []
@@ -70,33 +116,20 @@ class OllamaClient:
             return []
     
     async def chat(self, model: str, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
-        """聊天完成"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
-            
+        """聊天完成（汇总流式结果，返回与非流式接口相同的结构）"""
         try:
-            payload = {
-                "model": model,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": kwargs.get("temperature", 0.7),
-                    "top_p": kwargs.get("top_p", 0.9),
-                    "top_k": kwargs.get("top_k", 40),
-                }
-            }
+            contents = []
+            data = None
+            async for chunk in self._chat_chunks(model, messages, **kwargs):
+                contents.append(chunk.get("message", {}).get("content", ""))
+                data = chunk
             
-            async with self.session.post(
-                f"{self.base_url}/api/chat",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama API错误: {response.status} - {error_text}")
+            # 流在结束块之前断开时没有完整的响应结构，不返回半截结果
+            if data is None or not data.get("done"):
+                raise Exception("Ollama流式响应未正常结束")
+            
+            data["message"] = {"role": "assistant", "content": "".join(contents)}
+            return data
                     
         except asyncio.TimeoutError:
             raise Exception("Ollama响应超时，请检查模型是否正在运行")
@@ -104,34 +137,76 @@ class OllamaClient:
             logger.error(f"Ollama聊天调用失败: {e}")
             raise
     
+    async def chat_stream(self, model: str, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """流式聊天，逐块返回生成的内容"""
+        try:
+            async for chunk in self._chat_chunks(model, messages, **kwargs):
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    yield content
+                    
+        except asyncio.TimeoutError:
+            raise Exception("Ollama响应超时，请检查模型是否正在运行")
+        except Exception as e:
+            logger.error(f"Ollama流式聊天调用失败: {e}")
+            raise
+    
+    async def _chat_chunks(self, model: str, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """以NDJSON流式协议调用/api/chat，逐行产出响应块"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "options": _merge_options(_DEFAULT_CHAT_OPTIONS, kwargs)
+        }
+        
+        # 流式响应不限制总时长，只限制建立连接和两次数据之间的等待时间
+        async with self._get_session().post(
+            f"{self.base_url}/api/chat",
+            data=orjson.dumps(payload),
+            headers=JSON_HEADERS,
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=STREAM_CONNECT_TIMEOUT,
+                sock_read=STREAM_READ_TIMEOUT
+            )
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f"Ollama API错误: {response.status} - {error_text}")
+            
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama API错误: {chunk['error']}")
+                yield chunk
+                if chunk.get("done"):
+                    break
+    
     async def generate(self, model: str, prompt: str, **kwargs) -> Dict[str, Any]:
         """文本生成"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
-            
         try:
             payload = {
                 "model": model,
                 "prompt": prompt,
                 "stream": False,
-                "options": {
-                    "temperature": kwargs.get("temperature", 0.7),
-                    "top_p": kwargs.get("top_p", 0.9),
-                }
+                "options": _merge_options(_DEFAULT_GENERATE_OPTIONS, kwargs)
             }
             
-            async with self.session.post(
+            return await post_json(
+                self._get_session(),
                 f"{self.base_url}/api/generate",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Ollama生成错误: {response.status} - {error_text}")
+                payload,
+                timeout=60,
+                retries=0  # 生成耗时长且超时后Ollama仍在处理，重试只会重复占用模型
+            )
                     
+        except UpstreamStatusError as e:
+            logger.error(f"Ollama生成调用失败: {e}")
+            raise Exception(f"Ollama生成错误: {e}")
         except asyncio.TimeoutError:
             raise Exception("Ollama生成超时")
         except Exception as e:
@@ -141,41 +216,32 @@ class OllamaClient:
     async def pull_model(self, model: str) -> bool:
         """拉取模型"""
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-                
-            payload = {"name": model}
+            payload = {"name": model, "stream": False}
             
-            async with self.session.post(
+            await post_json(
+                self._get_session(),
                 f"{self.base_url}/api/pull",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=600)  # 10分钟超时
-            ) as response:
-                if response.status == 200:
-                    logger.info(f"模型 {model} 拉取成功")
-                    return True
-                else:
-                    logger.error(f"模型 {model} 拉取失败: {response.status}")
-                    return False
+                payload,
+                timeout=600,  # 10分钟超时
+                retries=0  # 重试会重新开始数GB的下载
+            )
+            logger.info(f"模型 {model} 拉取成功")
+            return True
                     
+        except UpstreamStatusError as e:
+            logger.error(f"模型 {model} 拉取失败: {e.status}")
+            return False
         except Exception as e:
             logger.error(f"拉取模型 {model} 异常: {e}")
             return False
     
     async def get_best_model(self, task_type: str = "general") -> str:
         """根据任务类型选择最佳模型"""
-        model_preferences = {
-            "general": "qwen2.5:7b",      # 通用任务优先中文模型
-            "code": "codellama:7b",       # 代码任务
-            "english": "llama3.1:8b",     # 英文任务
-            "chinese": "qwen2.5:7b",      # 中文任务
-        }
-        
-        preferred_model = model_preferences.get(task_type, "qwen2.5:7b")
+        preferred_model = _MODEL_PREFERENCES.get(task_type, "qwen2.5:7b")
         
         # 检查模型是否可用
         available_models = await self.list_models()
-        available_names = [m.get("name", "") for m in available_models]
+        available_names = {m.get("name", "") for m in available_models}
         
         if preferred_model in available_names:
             return preferred_model
@@ -6,188 +6,304 @@
 
 import re
 import json
-import random
-from typing import Dict, List, Any, Optional
+import hashlib
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime
 import logging
+from collections import OrderedDict, deque
 
 logger = logging.getLogger(__name__)
 
+# 查询预处理用的正则，模块加载时编译一次
+_STRIP_RE = re.compile(r'[^\w\s\u4e00-\u9fff\?\!\.，。？！]')
+
+# 回复缓存：引擎随请求创建，缓存放在模块级以便跨实例复用
+RESPONSE_CACHE_SIZE = 128
+_response_cache: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+
+# 规范化缓存键时忽略的停用词（不含任何话题关键词）
+_STOPWORDS = frozenset({
+    "a", "an", "the", "i", "me", "my", "to", "for", "of", "in", "on", "and", "or",
+    "is", "are", "am", "be", "do", "does", "with", "about", "some",
+    "的", "了", "呢", "啊", "吧", "我", "你"
+})
+
+def _canonicalize(processed_query: str) -> str:
+    """将预处理后的查询规范化为稳定的缓存键：去停用词、去重、排序
+
+    话题关键词不含空格，按空白切分后重排不影响话题匹配结果；
+    意图可能受词序影响，因此缓存键中另外带上识别出的意图。
+    """
+    return " ".join(sorted({token for token in processed_query.split() if token not in _STOPWORDS}))
+
+def _stable_choice(options: List[str], key: str) -> str:
+    """按键的稳定哈希选取候选回复：同一查询总得到同一回复，且不受PYTHONHASHSEED影响"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return options[int.from_bytes(digest, "big") % len(options)]
+
+def _build_intent_regex(intent_patterns: Dict[str, List[re.Pattern]]) -> re.Pattern:
+    """将各意图的模式合并为一个带命名分组的正则
+
+    每个意图包成从开头锚定的前瞻分支，按字典顺序依次尝试，
+    保证与逐个意图search时相同的优先级：命中的分支由match.lastgroup给出。
+    """
+    branches = []
+    for intent, patterns in intent_patterns.items():
+        alternation = "|".join(f"(?:{p.pattern})" for p in patterns)
+        branches.append(rf"(?=[\s\S]*?(?:{alternation}))(?P<{intent}>)")
+    return re.compile("|".join(branches), re.IGNORECASE)
+
+def _ascii_only(intent_patterns: Dict[str, List[re.Pattern]]) -> Dict[str, List[re.Pattern]]:
+    """只保留纯ASCII的顶层分支，供纯ASCII查询使用
+
+    含中文等非ASCII字符的分支不可能匹配纯ASCII查询，去掉后结果不变；
+    带分组或字符集的模式不拆分，整体按是否纯ASCII取舍。
+    """
+    result = {}
+    for intent, patterns in intent_patterns.items():
+        ascii_patterns = []
+        for pattern in patterns:
+            source = pattern.pattern
+            alternatives = [source] if "(" in source or "[" in source else source.split("|")
+            kept = [alt for alt in alternatives if alt.isascii()]
+            if kept:
+                ascii_patterns.append(re.compile("|".join(kept), pattern.flags))
+        if ascii_patterns:
+            result[intent] = ascii_patterns
+    return result
+
+def _trie_regex(words: List[str]) -> str:
+    """将关键词列表压缩为前缀树形式的正则，如 ["plan", "planning", "play"] -> pla(?:n(?:ning)?|y)
+
+    可选的后缀贪婪匹配，因此在同一起点总是优先匹配最长的关键词。
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # 词尾标记
+    
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+    
+    return build(trie)
+
+def _build_topic_index(knowledge_base: Dict[str, Any]) -> Tuple[re.Pattern, Dict[str, List[str]], Dict[str, Set[str]]]:
+    """构建话题关键词的单次扫描索引
+
+    返回 (关键词正则, 关键词->话题列表, 关键词->其包含的全部关键词)。
+    正则为前缀树压缩后的关键词并包在前瞻里，finditer在每个位置给出最长的关键词；
+    被它包含的较短关键词通过第三项补齐，从而与逐个关键词做子串判断的结果一致。
+    """
+    keyword_topics: Dict[str, List[str]] = {}
+    for topic, info in knowledge_base.items():
+        for keyword in info["keywords"]:
+            keyword_topics.setdefault(keyword, []).append(topic)
+    
+    keyword_closure = {kw: {other for other in keyword_topics if other in kw} for kw in keyword_topics}
+    topic_re = re.compile("(?=(" + _trie_regex(list(keyword_topics)) + "))")
+    return topic_re, keyword_topics, keyword_closure
+
+# 知识库
+_KNOWLEDGE_BASE: Dict[str, Any] = {
+    "技能分析": {
+        "keywords": ["技能", "能力", "水平", "分析", "评估", "skill", "ability"],
+        "responses": [
+            "根据你的GitHub和LeetCode数据，我可以为你分析技能水平。",
+            "技能分析可以帮助你了解自己的优势和不足。",
+            "建议你先完成技能分析，然后制定学习计划。",
+            "我可以从多个维度评估你的技术能力：编程语言、算法能力、项目经验等。"
+        ],
+        "suggestions": [
+            "查看技能分析报告",
+            "上传代码进行分析",
+            "连接GitHub账号",
+            "输入LeetCode用户名"
+        ]
+    },
+    "学习规划": {
+        "keywords": ["学习", "计划", "路径", "规划", "提升", "learning", "plan", "study"],
+        "responses": [
+            "我可以根据你的目标制定个性化学习路径。",
+            "学习计划应该循序渐进，建议从基础开始。",
+            "每日坚持学习1-2小时，效果会更好。",
+            "根据你的技能水平和目标岗位，我会推荐最适合的学习资源。"
+        ],
+        "suggestions": [
+            "生成学习路径",
+            "设定学习目标",
+            "查看推荐资源",
+            "制定学习计划"
+        ]
+    },
+    "求职指导": {
+        "keywords": ["求职", "面试", "简历", "工作", "岗位", "job", "interview", "resume"],
+        "responses": [
+            "求职前建议先完善技能，提高竞争力。",
+            "简历要突出项目经验和技术能力。",
+            "面试时要展现你的学习能力和解决问题的思路。",
+            "我可以帮你分析岗位要求，匹配你的技能水平。"
+        ],
+        "suggestions": [
+            "分析简历",
+            "岗位匹配",
+            "面试准备",
+            "技能提升建议"
+        ]
+    },
+    "编程学习": {
+        "keywords": ["编程", "代码", "算法", "开发", "语言", "programming", "code", "algorithm"],
+        "responses": [
+            "编程学习要理论结合实践，多写项目。",
+            "建议从一门语言开始，深入学习后再扩展。",
+            "LeetCode刷题可以提高算法思维。",
+            "项目经验比单纯的理论学习更重要。"
+        ],
+        "suggestions": [
+            "选择编程语言",
+            "制定练习计划",
+            "推荐学习资源",
+            "项目实战指导"
+        ]
+    },
+    "职业发展": {
+        "keywords": ["职业", "发展", "晋升", "转行", "career", "development"],
+        "responses": [
+            "职业发展需要明确目标和持续学习。",
+            "技术岗位要保持技术敏感度，关注行业趋势。",
+            "软技能和硬技能同样重要。",
+            "建议制定3-5年的职业规划。"
+        ],
+        "suggestions": [
+            "职业规划",
+            "技能提升",
+            "行业分析",
+            "发展建议"
+        ]
+    },
+    "项目经验": {
+        "keywords": ["项目", "经验", "作品", "portfolio", "project"],
+        "responses": [
+            "项目经验是技术能力的最好证明。",
+            "建议从小项目开始，逐步增加复杂度。",
+            "开源项目是很好的学习和展示平台。",
+            "项目要有完整的文档和演示。"
+        ],
+        "suggestions": [
+            "项目创意",
+            "技术选型",
+            "项目管理",
+            "作品展示"
+        ]
+    }
+}
+
+# 意图识别模式（按search语义匹配，模式首尾不写多余的".*"，避免长查询上的回溯）
+_INTENT_PATTERN_SOURCES: Dict[str, List[str]] = {
+    "greeting": [
+        r"你好|hi|hello|嗨|您好",
+        r"早上好|下午好|晚上好|morning|afternoon|evening",
+        r"在吗|在不在|are you there"
+    ],
+    "question": [
+        r"\?|？",
+        r"怎么|如何|什么|为什么|为啥",
+        r"how|what|why|when|where"
+    ],
+    "request": [
+        r"帮我|给我|我想|请",
+        r"可以.*吗|能.*吗|能否",
+        r"help|please|can you"
+    ],
+    "complaint": [
+        r"不好|不行|有问题|bug|错误",
+        r"慢|卡|不工作|failed|error",
+        r"没用|不对|wrong"
+    ],
+    "praise": [
+        r"好的|不错|很好|棒|excellent|good|great",
+        r"谢谢|感谢|thank you|thanks",
+        r"有用|有帮助|helpful"
+    ]
+}
+
+# 预编译的意图模式（忽略大小写）及合并后的意图正则
+_INTENT_PATTERNS: Dict[str, List[re.Pattern]] = {
+    intent: [re.compile(p, re.IGNORECASE) for p in pats]
+    for intent, pats in _INTENT_PATTERN_SOURCES.items()
+}
+_INTENT_RE = _build_intent_regex(_INTENT_PATTERNS)
+_INTENT_RE_ASCII = _build_intent_regex(_ascii_only(_INTENT_PATTERNS))
+
+# 话题关键词扫描索引
+_TOPIC_RE, _KEYWORD_TOPICS, _KEYWORD_CLOSURE = _build_topic_index(_KNOWLEDGE_BASE)
+_TOPIC_RE_ASCII = re.compile("(?=(" + _trie_regex([kw for kw in _KEYWORD_TOPICS if kw.isascii()]) + "))")
+
+# 回复模板
+_RESPONSE_TEMPLATES: Dict[str, List[str]] = {
+    "greeting": [
+        "你好！我是小智，你的AI学习助手。有什么可以帮助你的吗？",
+        "嗨！很高兴为你服务，我可以帮你规划学习路径和职业发展。",
+        "你好！我可以协助你进行技能分析、学习规划和求职指导。",
+        "欢迎！我是专业的程序员求职助手，随时为你答疑解惑。"
+    ],
+    "question": [
+        "这是个很好的问题！让我为你分析一下...",
+        "根据我的理解，这个问题可以从几个角度来看...",
+        "我来帮你解答这个问题。",
+        "让我基于我的知识为你详细解释..."
+    ],
+    "request": [
+        "当然可以！我很乐意帮助你。",
+        "没问题，我来协助你完成这个任务。",
+        "我会尽力帮助你实现这个目标。",
+        "好的，让我为你提供详细的指导。"
+    ],
+    "complaint": [
+        "抱歉给你带来了困扰，让我帮你解决这个问题。",
+        "我理解你的困难，让我们一起找到解决方案。",
+        "感谢你的反馈，我会努力改进。",
+        "让我帮你分析问题所在，找到更好的解决办法。"
+    ],
+    "praise": [
+        "谢谢你的认可！我会继续努力帮助你。",
+        "很高兴能帮到你！还有其他需要协助的吗？",
+        "感谢你的反馈！有任何问题随时找我。",
+        "能够帮助你我很开心！继续加油！"
+    ],
+    "default": [
+        "我理解你的意思，让我为你提供一些建议。",
+        "基于你的情况，我建议你可以考虑以下几点。",
+        "这确实是个值得思考的问题。",
+        "让我根据我的知识为你提供一些想法。"
+    ]
+}
+# 各话题的具体建议
+_SPECIFIC_ADVICE = {
+    "技能分析": "你可以通过GitHub分析、LeetCode分析等功能来全面了解自己的技能水平。",
+    "学习规划": "建议设定明确的学习目标，制定详细的时间计划，并定期评估学习效果。",
+    "求职指导": "完善你的技术简历，准备技术面试，关注目标公司的技术栈要求。",
+    "编程学习": "推荐采用项目驱动的学习方式，在实践中掌握编程技能。",
+    "职业发展": "持续关注行业趋势，培养核心竞争力，建立专业人脉网络。"
+}
+
 class RuleBasedEngine:
     """基于规则的智能引擎"""
     
     def __init__(self):
-        self.knowledge_base = self._load_knowledge_base()
-        self.intent_patterns = self._load_intent_patterns()
-        self.response_templates = self._load_response_templates()
-        self.context_memory = {}  # 简单的上下文记忆
+        # 知识库、模式和模板均为模块级共享对象，实例化时不再重复构建和编译
+        self.knowledge_base = _KNOWLEDGE_BASE
+        self.intent_patterns = _INTENT_PATTERNS
+        self.response_templates = _RESPONSE_TEMPLATES
+        self.context_memory: Dict[str, deque] = {}  # 简单的上下文记忆，每个用户最多保留最近5轮
         
-    def _load_knowledge_base(self) -> Dict[str, Any]:
-        """加载知识库"""
-        return {
-            "技能分析": {
-                "keywords": ["技能", "能力", "水平", "分析", "评估", "skill", "ability"],
-                "responses": [
-                    "根据你的GitHub和LeetCode数据，我可以为你分析技能水平。",
-                    "技能分析可以帮助你了解自己的优势和不足。",
-                    "建议你先完成技能分析，然后制定学习计划。",
-                    "我可以从多个维度评估你的技术能力：编程语言、算法能力、项目经验等。"
-                ],
-                "suggestions": [
-                    "查看技能分析报告",
-                    "上传代码进行分析",
-                    "连接GitHub账号",
-                    "输入LeetCode用户名"
-                ]
-            },
-            "学习规划": {
-                "keywords": ["学习", "计划", "路径", "规划", "提升", "learning", "plan", "study"],
-                "responses": [
-                    "我可以根据你的目标制定个性化学习路径。",
-                    "学习计划应该循序渐进，建议从基础开始。",
-                    "每日坚持学习1-2小时，效果会更好。",
-                    "根据你的技能水平和目标岗位，我会推荐最适合的学习资源。"
-                ],
-                "suggestions": [
-                    "生成学习路径",
-                    "设定学习目标",
-                    "查看推荐资源",
-                    "制定学习计划"
-                ]
-            },
-            "求职指导": {
-                "keywords": ["求职", "面试", "简历", "工作", "岗位", "job", "interview", "resume"],
-                "responses": [
-                    "求职前建议先完善技能，提高竞争力。",
-                    "简历要突出项目经验和技术能力。",
-                    "面试时要展现你的学习能力和解决问题的思路。",
-                    "我可以帮你分析岗位要求，匹配你的技能水平。"
-                ],
-                "suggestions": [
-                    "分析简历",
-                    "岗位匹配",
-                    "面试准备",
-                    "技能提升建议"
-                ]
-            },
-            "编程学习": {
-                "keywords": ["编程", "代码", "算法", "开发", "语言", "programming", "code", "algorithm"],
-                "responses": [
-                    "编程学习要理论结合实践，多写项目。",
-                    "建议从一门语言开始，深入学习后再扩展。",
-                    "LeetCode刷题可以提高算法思维。",
-                    "项目经验比单纯的理论学习更重要。"
-                ],
-                "suggestions": [
-                    "选择编程语言",
-                    "制定练习计划",
-                    "推荐学习资源",
-                    "项目实战指导"
-                ]
-            },
-            "职业发展": {
-                "keywords": ["职业", "发展", "晋升", "转行", "career", "development"],
-                "responses": [
-                    "职业发展需要明确目标和持续学习。",
-                    "技术岗位要保持技术敏感度，关注行业趋势。",
-                    "软技能和硬技能同样重要。",
-                    "建议制定3-5年的职业规划。"
-                ],
-                "suggestions": [
-                    "职业规划",
-                    "技能提升",
-                    "行业分析",
-                    "发展建议"
-                ]
-            },
-            "项目经验": {
-                "keywords": ["项目", "经验", "作品", "portfolio", "project"],
-                "responses": [
-                    "项目经验是技术能力的最好证明。",
-                    "建议从小项目开始，逐步增加复杂度。",
-                    "开源项目是很好的学习和展示平台。",
-                    "项目要有完整的文档和演示。"
-                ],
-                "suggestions": [
-                    "项目创意",
-                    "技术选型",
-                    "项目管理",
-                    "作品展示"
-                ]
-            }
-        }
-    
-    def _load_intent_patterns(self) -> Dict[str, List[str]]:
-        """加载意图识别模式"""
-        return {
-            "greeting": [
-                r"你好|hi|hello|嗨|您好",
-                r"早上好|下午好|晚上好|morning|afternoon|evening",
-                r"在吗|在不在|are you there"
-            ],
-            "question": [
-                r".*\?|.*？",
-                r"怎么.*|如何.*|什么.*|为什么.*|为啥.*",
-                r"how.*|what.*|why.*|when.*|where.*"
-            ],
-            "request": [
-                r"帮我.*|给我.*|我想.*|请.*",
-                r"可以.*吗|能.*吗|能否.*",
-                r"help.*|please.*|can you.*"
-            ],
-            "complaint": [
-                r"不好|不行|有问题|bug|错误",
-                r"慢|卡|不工作|failed|error",
-                r"没用|不对|wrong"
-            ],
-            "praise": [
-                r"好的|不错|很好|棒|excellent|good|great",
-                r"谢谢|感谢|thank you|thanks",
-                r"有用|有帮助|helpful"
-            ]
-        }
-    
-    def _load_response_templates(self) -> Dict[str, List[str]]:
-        """加载回复模板"""
-        return {
-            "greeting": [
-                "你好！我是小智，你的AI学习助手。有什么可以帮助你的吗？",
-                "嗨！很高兴为你服务，我可以帮你规划学习路径和职业发展。",
-                "你好！我可以协助你进行技能分析、学习规划和求职指导。",
-                "欢迎！我是专业的程序员求职助手，随时为你答疑解惑。"
-            ],
-            "question": [
-                "这是个很好的问题！让我为你分析一下...",
-                "根据我的理解，这个问题可以从几个角度来看...",
-                "我来帮你解答这个问题。",
-                "让我基于我的知识为你详细解释..."
-            ],
-            "request": [
-                "当然可以！我很乐意帮助你。",
-                "没问题，我来协助你完成这个任务。",
-                "我会尽力帮助你实现这个目标。",
-                "好的，让我为你提供详细的指导。"
-            ],
-            "complaint": [
-                "抱歉给你带来了困扰，让我帮你解决这个问题。",
-                "我理解你的困难，让我们一起找到解决方案。",
-                "感谢你的反馈，我会努力改进。",
-                "让我帮你分析问题所在，找到更好的解决办法。"
-            ],
-            "praise": [
-                "谢谢你的认可！我会继续努力帮助你。",
-                "很高兴能帮到你！还有其他需要协助的吗？",
-                "感谢你的反馈！有任何问题随时找我。",
-                "能够帮助你我很开心！继续加油！"
-            ],
-            "default": [
-                "我理解你的意思，让我为你提供一些建议。",
-                "基于你的情况，我建议你可以考虑以下几点。",
-                "这确实是个值得思考的问题。",
-                "让我根据我的知识为你提供一些想法。"
-            ]
-        }
-    
     async def generate_response(self, query: str, user_context: Dict = None) -> Dict[str, Any]:
         """生成规则化回复"""
         try:
@@ -197,26 +313,25 @@ class RuleBasedEngine:
             # 2. 意图识别
             intent = self._identify_intent(processed_query)
             
-            # 3. 关键词匹配
-            topic = self._match_topic(processed_query)
+            # 3. 规范化后相同的查询（同意图、同上下文）直接复用缓存的回复
+            canonical_query = _canonicalize(processed_query)
+            cache_key = self._response_cache_key(canonical_query, intent, user_context)
+            reply = _response_cache.get(cache_key) if cache_key else None
+            if reply is not None:
+                _response_cache.move_to_end(cache_key)
+            else:
+                reply = self._build_reply(processed_query, canonical_query, intent, user_context)
+                if cache_key:
+                    _response_cache[cache_key] = reply
+                    if len(_response_cache) > RESPONSE_CACHE_SIZE:
+                        _response_cache.popitem(last=False)
             
-            # 4. 生成回复
-            response = self._generate_contextual_response(
-                processed_query, intent, topic, user_context
-            )
-            
-            # 5. 生成建议
-            suggestions = self._generate_suggestions(topic, user_context)
-            
-            # 6. 更新上下文记忆
-            self._update_context_memory(query, response, user_context)
+            # 4. 更新上下文记忆
+            self._update_context_memory(query, reply["content"], user_context)
             
             return {
-                "content": response,
-                "intent": intent,
-                "topic": topic,
-                "suggestions": suggestions,
-                "confidence": self._calculate_confidence(intent, topic),
+                **reply,
+                "suggestions": list(reply["suggestions"]),
                 "source": "rule_based",
                 "timestamp": datetime.now().isoformat()
             }
@@ -232,54 +347,80 @@ class RuleBasedEngine:
                 "source": "rule_based_fallback"
             }
     
+    def _build_reply(self, processed_query: str, canonical_query: str, intent: str, user_context: Optional[Dict]) -> Dict[str, Any]:
+        """根据预处理后的查询生成回复内容（不含时间戳等每次变化的字段）"""
+        # 关键词匹配
+        topic = self._match_topic(processed_query)
+        
+        # 生成回复
+        response = self._generate_contextual_response(
+            canonical_query, intent, topic, user_context
+        )
+        
+        # 生成建议
+        suggestions = self._generate_suggestions(topic, user_context)
+        
+        return {
+            "content": response,
+            "intent": intent,
+            "topic": topic,
+            "suggestions": suggestions,
+            "confidence": self._calculate_confidence(intent, topic)
+        }
+    
+    def _response_cache_key(self, canonical_query: str, intent: str, user_context: Optional[Dict]) -> Optional[Tuple[Any, ...]]:
+        """回复缓存键：只包含会影响回复内容的字段，无法哈希时不缓存"""
+        if user_context:
+            key = (canonical_query, intent, True, user_context.get("skill_level"), user_context.get("target_job"))
+        else:
+            key = (canonical_query, intent, False, None, None)
+        
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+    
     def _preprocess_query(self, query: str) -> str:
         """预处理查询"""
-        # 转换为小写
-        processed = query.lower().strip()
-        
-        # 移除多余的空格
-        processed = re.sub(r'\s+', ' ', processed)
+        # 转换为小写，并合并多余的空格（split()按与\s相同的空白字符切分并去掉首尾空白）
+        processed = " ".join(query.lower().split())
         
         # 移除特殊字符（保留中文、英文、数字、常用标点）
-        processed = re.sub(r'[^\w\s\u4e00-\u9fff\?\!\.，。？！]', '', processed)
+        processed = _STRIP_RE.sub('', processed)
         
         return processed
     
     def _identify_intent(self, query: str) -> str:
         """识别用户意图"""
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, query, re.IGNORECASE):
-                    return intent
-        
-        return "unknown"
+        # 纯ASCII查询（str.isascii为O(1)）只需匹配英文分支
+        intent_re = _INTENT_RE_ASCII if query.isascii() else _INTENT_RE
+        match = intent_re.match(query)
+        return match.lastgroup if match else "unknown"
     
     def _match_topic(self, query: str) -> str:
         """匹配话题"""
-        topic_scores = {}
+        # 一次扫描找出查询中出现的全部关键词
+        found = set()
+        topic_re = _TOPIC_RE_ASCII if query.isascii() else _TOPIC_RE
+        for match in topic_re.finditer(query):
+            found |= _KEYWORD_CLOSURE[match.group(1)]
         
-        for topic, info in self.knowledge_base.items():
-            score = 0
-            for keyword in info["keywords"]:
-                # 完全匹配得分更高
-                if keyword in query:
-                    score += 2
-                # 部分匹配
-                elif any(keyword in word for word in query.split()):
-                    score += 1
-            
-            if score > 0:
-                topic_scores[topic] = score
+        if not found:
+            return "general"
         
-        if topic_scores:
-            return max(topic_scores, key=topic_scores.get)
+        # 每个命中的关键词为所属话题加2分，同分时按知识库顺序取先出现的话题
+        topic_scores = dict.fromkeys(self.knowledge_base, 0)
+        for keyword in found:
+            for topic in _KEYWORD_TOPICS[keyword]:
+                topic_scores[topic] += 2
         
-        return "general"
+        return max(topic_scores, key=topic_scores.get)
     
     def _generate_contextual_response(self, query: str, intent: str, topic: str, context: Dict) -> str:
         """生成上下文相关回复"""
         # 基础回复
-        base_response = self._get_base_response(intent, topic)
+        base_response = self._get_base_response(intent, topic, query)
         
         # 添加个性化内容
         if context:
@@ -294,20 +435,20 @@ class RuleBasedEngine:
         
         return base_response
     
-    def _get_base_response(self, intent: str, topic: str) -> str:
-        """获取基础回复"""
+    def _get_base_response(self, intent: str, topic: str, selection_key: str) -> str:
+        """获取基础回复（按selection_key确定性选取）"""
         # 优先使用话题相关回复
         if topic in self.knowledge_base:
             responses = self.knowledge_base[topic]["responses"]
-            return random.choice(responses)
+            return _stable_choice(responses, selection_key)
         
         # 使用意图相关回复
         if intent in self.response_templates:
             responses = self.response_templates[intent]
-            return random.choice(responses)
+            return _stable_choice(responses, selection_key)
         
         # 默认回复
-        return random.choice(self.response_templates["default"])
+        return _stable_choice(self.response_templates["default"], selection_key)
     
     def _add_personal_context(self, response: str, context: Dict, topic: str) -> str:
         """添加个性化上下文"""
@@ -340,20 +481,12 @@ class RuleBasedEngine:
     
     def _get_specific_advice(self, topic: str, context: Dict) -> str:
         """获取具体建议"""
-        advice_map = {
-            "技能分析": "你可以通过GitHub分析、LeetCode分析等功能来全面了解自己的技能水平。",
-            "学习规划": "建议设定明确的学习目标，制定详细的时间计划，并定期评估学习效果。",
-            "求职指导": "完善你的技术简历，准备技术面试，关注目标公司的技术栈要求。",
-            "编程学习": "推荐采用项目驱动的学习方式，在实践中掌握编程技能。",
-            "职业发展": "持续关注行业趋势，培养核心竞争力，建立专业人脉网络。"
-        }
-        
-        return advice_map.get(topic, "")
+        return _SPECIFIC_ADVICE.get(topic, "")
     
     def _generate_suggestions(self, topic: str, context: Dict) -> List[str]:
         """生成建议"""
         if topic in self.knowledge_base:
-            base_suggestions = self.knowledge_base[topic].get("suggestions", [])
+            base_suggestions = list(self.knowledge_base[topic].get("suggestions", []))
         else:
             base_suggestions = ["查看帮助文档", "联系技术支持"]
         
@@ -387,26 +520,23 @@ class RuleBasedEngine:
         try:
             user_id = context.get("user_id") if context else "anonymous"
             
-            if user_id not in self.context_memory:
-                self.context_memory[user_id] = []
+            memory = self.context_memory.get(user_id)
+            if memory is None:
+                memory = self.context_memory[user_id] = deque(maxlen=5)
             
-            # 保存最近5轮对话
-            self.context_memory[user_id].append({
+            # 保存最近5轮对话，超出时deque自动丢弃最早的一轮
+            memory.append({
                 "query": query,
                 "response": response,
                 "timestamp": datetime.now().isoformat()
             })
-            
-            # 只保留最近5轮
-            if len(self.context_memory[user_id]) > 5:
-                self.context_memory[user_id] = self.context_memory[user_id][-5:]
                 
         except Exception as e:
             logger.error(f"更新上下文记忆失败: {e}")
     
     def get_context_memory(self, user_id: str) -> List[Dict]:
         """获取用户的上下文记忆"""
-        return self.context_memory.get(user_id, [])
+        return list(self.context_memory.get(user_id, ()))
     
     def clear_context_memory(self, user_id: str):
         """清除用户的上下文记忆"""
@@ -2,8 +2,57 @@ from typing import List, Dict
 from sqlalchemy.orm import Session
 from app.models.skill import Skill, SkillReport
 from app.models.user import User
-import json
+import orjson
+import heapq
 from collections import defaultdict
+from operator import itemgetter
+
+# 关联技能：会Python的也部分匹配Django等
+_SKILL_RELATIONS = {
+    "Python": ["Django", "Flask"],
+    "Java": ["Spring"],
+    "JavaScript": ["React", "Vue"]
+}
+# 反向索引：岗位要求的技能 -> 可部分匹配它的用户技能
+_RELATED_BY_REQUIREMENT: Dict[str, List[str]] = {
+    child: [parent for parent, children in _SKILL_RELATIONS.items() if child in children]
+    for children in _SKILL_RELATIONS.values()
+    for child in children
+}
+_RELATION_FACTOR = 0.6  # 关联技能匹配度为60%
+
+_LEARNING_RESOURCES = {
+    "Python": "https://learnpython.com",
+    "Java": "https://learnjava.com",
+    "React": "https://reactjs.org/docs"
+}
+
+def _language_proficiency(evidence: Dict) -> float:
+    """编程语言熟练度：解题数量 + 难度加分 + 代码质量分"""
+    get = evidence.get
+    # 基础分：解决问题数量
+    base = get('problems_solved', 0) * 4
+    # 难度加分：困难题额外权重
+    difficulty_bonus = get('easy_solved', 0) + get('medium_solved', 0) * 3 + get('hard_solved', 0) * 6
+    # 代码质量分：平均运行时间和内存使用
+    avg_runtime = min(get('avg_runtime_percentile', 50) / 50, 2.0)
+    avg_memory = min(get('avg_memory_percentile', 50) / 50, 2.0)
+    quality_bonus = (avg_runtime + avg_memory) * 5
+    
+    return min(base + difficulty_bonus + quality_bonus, 100)
+
+def _algorithm_proficiency(evidence: Dict) -> float:
+    """算法熟练度多维评估：解题难度、最优解比例、解题速度、通过率"""
+    get = evidence.get
+    problem_solving = get('easy_solved', 0) + get('medium_solved', 0) * 3 + get('hard_solved', 0) * 5
+    # 考虑最优解比例
+    optimal_solution_rate = min(get('optimal_solution_rate', 0.5), 1.0) * 20
+    # 考虑解题速度
+    speed_factor = min(get('avg_solving_speed_percentile', 50) / 50, 1.5)
+    # 考虑通过率
+    acceptance_rate = min(get('acceptance_rate', 1.0), 1.0)
+    
+    return min((problem_solving + optimal_solution_rate) * speed_factor * acceptance_rate, 100)
 
 class SkillAnalyzer:
     def __init__(self, db: Session):
@@ -19,48 +68,44 @@ class SkillAnalyzer:
         """生成技能分析报告"""
         skills = self.db.query(Skill).filter(Skill.user_id == user_id).all()
         
-        # 计算加权技能分
+        # 一次遍历同时完成加权计分、明细、按分类统计和分布计数
         weighted_skills = []
+        details = []
+        by_category = {}
+        skill_distribution = {}
         for s in skills:
-            weight = self.skill_weights.get(s.skill_category, 1.0)
-            weighted_skills.append((
-                s.skill_name,
-                s.proficiency_level * weight,
-                s.skill_category
-            ))
-        
-        report_data = {
-            "summary": {
-                "total_skills": len(skills),
-                "top_skills": sorted(
-                    weighted_skills,
-                    key=lambda x: x[1], reverse=True)[:5],
-                "skill_distribution": defaultdict(int)
-            },
-            "by_category": {},
-            "details": [{
+            category = s.skill_category
+            weighted_level = s.proficiency_level * self.skill_weights.get(category, 1.0)
+            
+            weighted_skills.append((s.skill_name, weighted_level, category))
+            details.append({
                 "skill_name": s.skill_name,
-                "category": s.skill_category,
+                "category": category,
                 "level": s.proficiency_level,
-                "weighted_level": s.proficiency_level * self.skill_weights.get(s.skill_category, 1.0),
+                "weighted_level": weighted_level,
                 "source": s.source
-            } for s in skills]
-        }
-        
-        # 按分类统计
-        for s in skills:
-            if s.skill_category not in report_data["by_category"]:
-                report_data["by_category"][s.skill_category] = []
-            report_data["by_category"][s.skill_category].append({
+            })
+            by_category.setdefault(category, []).append({
                 "skill_name": s.skill_name,
                 "level": s.proficiency_level,
-                "weighted_level": s.proficiency_level * self.skill_weights.get(s.skill_category, 1.0)
+                "weighted_level": weighted_level
             })
-            report_data["summary"]["skill_distribution"][s.skill_category] += 1
+            skill_distribution[category] = skill_distribution.get(category, 0) + 1
+        
+        report_data = {
+            "summary": {
+                "total_skills": len(skills),
+                # 只取前5名，无需整体排序
+                "top_skills": heapq.nlargest(5, weighted_skills, key=itemgetter(1)),
+                "skill_distribution": skill_distribution
+            },
+            "by_category": by_category,
+            "details": details
+        }
         
         report = SkillReport(
             user_id=user_id,
-            report_data=json.dumps(report_data)
+            report_data=orjson.dumps(report_data, option=orjson.OPT_NON_STR_KEYS).decode()
         )
         
         self.db.add(report)
@@ -78,42 +123,11 @@ class SkillAnalyzer:
             name = skill_data.get('name', '')
             evidence = skill_data.get('evidence', {})
             
-            # 更细致的熟练度计算
+            # 更细致的熟练度计算：编程语言与算法（默认）各用一套纯函数评分
             if category == 'programming_language':
-                # 基础分：解决问题数量
-                base = evidence.get('problems_solved', 0) * 4
-                # 难度加分：困难题额外权重
-                difficulty_bonus = (
-                    evidence.get('easy_solved', 0) * 1 +
-                    evidence.get('medium_solved', 0) * 3 +
-                    evidence.get('hard_solved', 0) * 6
-                )
-                # 代码质量分：平均运行时间和内存使用
-                avg_runtime = min(evidence.get('avg_runtime_percentile', 50) / 50, 2.0)
-                avg_memory = min(evidence.get('avg_memory_percentile', 50) / 50, 2.0)
-                quality_bonus = (avg_runtime + avg_memory) * 5
-                
-                proficiency = min(base + difficulty_bonus + quality_bonus, 100)
-            else:  # algorithm
-                # 算法熟练度多维评估
-                problem_solving = (
-                    evidence.get('easy_solved', 0) * 1 +
-                    evidence.get('medium_solved', 0) * 3 +
-                    evidence.get('hard_solved', 0) * 5
-                )
-                # 考虑最优解比例
-                optimal_solution_rate = min(evidence.get('optimal_solution_rate', 0.5), 1.0) * 20
-                # 考虑解题速度
-                speed_factor = min(evidence.get('avg_solving_speed_percentile', 50) / 50, 1.5)
-                # 考虑通过率
-                acceptance_rate = min(evidence.get('acceptance_rate', 1.0), 1.0)
-                
-                proficiency = min(
-                    (problem_solving + optimal_solution_rate) * 
-                    speed_factor * 
-                    acceptance_rate, 
-                    100
-                )
+                proficiency = _language_proficiency(evidence)
+            else:
+                proficiency = _algorithm_proficiency(evidence)
             
             skill = Skill(
                 user_id=user_id,
@@ -121,7 +135,7 @@ class SkillAnalyzer:
                 skill_category=category,
                 proficiency_level=proficiency,
                 source="leetcode",
-                evidence=json.dumps(evidence)
+                evidence=orjson.dumps(evidence, option=orjson.OPT_NON_STR_KEYS).decode()
             )
             skills.append(skill)
         
@@ -135,11 +149,13 @@ class SkillAnalyzer:
         missing_skills = []
         match_score = 0
         max_possible = 0
-        skill_relations = {
-            "Python": ["Django", "Flask"],
-            "Java": ["Spring"],
-            "JavaScript": ["React", "Vue"]
-        }
+        
+        # 预先建立技能名索引：精确匹配忽略大小写（同名取第一个），关联匹配按原名
+        by_lower_name = {}
+        by_name = defaultdict(list)
+        for skill in user_skills:
+            by_lower_name.setdefault(skill.skill_name.lower(), skill)
+            by_name[skill.skill_name].append(skill)
         
         for req in job_requirements.get('skills', []):
             req_name = req['name']
@@ -150,17 +166,12 @@ class SkillAnalyzer:
             max_possible += req_level * req_weight * req_priority
             
             # 查找匹配技能（精确匹配+关联技能）
-            matched = None
-            related_matches = []
-            
-            for skill in user_skills:
-                # 精确匹配
-                if skill.skill_name.lower() == req_name.lower():
-                    matched = skill
-                    break
-                # 关联技能匹配（如会Python的也部分匹配Django）
-                if req_name in skill_relations.get(skill.skill_name, []):
-                    related_matches.append((skill, 0.6))  # 关联技能匹配度为60%
+            matched = by_lower_name.get(req_name.lower())
+            related_matches = [] if matched else [
+                (skill, _RELATION_FACTOR)
+                for parent in _RELATED_BY_REQUIREMENT.get(req_name, ())
+                for skill in by_name.get(parent, ())
+            ]
             
             if matched:
                 # 计算精确匹配度
@@ -214,19 +225,12 @@ class SkillAnalyzer:
 
     def _generate_skill_gap_analysis(self, missing_skills: List[Dict]) -> List[Dict]:
         """生成技能缺口分析"""
-        gap_analysis = []
-        learning_resources = {
-            "Python": "https://learnpython.com",
-            "Java": "https://learnjava.com",
-            "React": "https://reactjs.org/docs"
-        }
-        
-        for skill in missing_skills:
-            gap_analysis.append({
+        return [
+            {
                 'skill_name': skill['name'],
                 'priority': skill['priority'],
                 'learning_path': f"预计需要{skill['required_level']//20 + 1}周掌握",
-                'resources': learning_resources.get(skill['name'], "通用学习资源")
-            })
-        
-        return gap_analysis
+                'resources': _LEARNING_RESOURCES.get(skill['name'], "通用学习资源")
+            }
+            for skill in missing_skills
+        ]
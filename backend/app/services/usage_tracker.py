@@ -4,23 +4,60 @@
 监控免费API的使用情况，防止超出限制
 """
 
-import asyncio
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+import os
+import time
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
 import json
 import logging
-from collections import defaultdict
+import redis
+import redis.asyncio as aioredis
 
 logger = logging.getLogger(__name__)
 
+# 允许通过的判定缓存1秒；用量达到限额90%后不再缓存，每次都重新计算
+DECISION_CACHE_TTL = 1.0
+NEAR_LIMIT_RATIO = 0.9
+
+# 全部服务使用统计的缓存时间（秒），仪表盘轮询时每个用户每秒最多计算一次
+STATS_CACHE_TTL = 1.0
+
+# 过期数据清理间隔（秒），由应用生命周期中的后台任务按此间隔调用cleanup_expired_data
+CLEANUP_INTERVAL = 3600
+
+# Redis计数键的过期时间（秒）：每日计数保留8天（与内存版保留7天前的数据一致），每分钟计数保留2分钟
+REDIS_DAILY_TTL = 8 * 86400
+REDIS_MINUTE_TTL = 120
+REDIS_TIMEOUT = 0.5  # 计数请求在每次对话的关键路径上，超时要短
+
+# 未配置的服务视为不限量：(每日限额, 每分钟限额, 每日不限量, 每分钟不限量)
+_UNLIMITED = (-1, -1, True, True)
+
 class UsageTracker:
-    """使用量追踪器"""
+    """
+    使用量追踪器
+    
+    公开方法都是协程，只在事件循环线程内调用；两次await之间的读-改-写不会被打断，计数无需加锁。
+    """
+    
+    # 是否缓存允许判定：计数只在本进程内变化时缓存才能被及时作废
+    cache_decisions = True
     
     def __init__(self):
         # 使用内存存储，生产环境建议使用Redis
-        self.daily_usage = defaultdict(lambda: defaultdict(int))
-        self.minute_usage = defaultdict(lambda: defaultdict(int))
-        self.last_cleanup = datetime.now()
+        # 键为(时间桶, 用户ID, 服务)：本地日期桶（自纪元起的天数）或分钟桶（自纪元起的分钟数）
+        self.daily_usage: Dict[Tuple[int, int, str], int] = {}
+        # 上次清理后daily_usage中日期桶的下界，清理截止日未超过它时无需扫描
+        self._daily_floor = -1
+        # 每分钟计数只需当前和上一分钟，用按 分钟桶 % 2 轮换的两个槽位保存，内存只与活跃用户数有关
+        self._minute_slots: Tuple[Dict[Tuple[int, int, str], int], ...] = ({}, {})
+        self._slot_minutes = [-1, -1]
+        self._bucket_minute = -1
+        self._bucket_day = -1
+        # (用户ID, 服务) -> 允许判定的过期时间（monotonic），只缓存允许的结果
+        self._decision_cache: Dict[Tuple[int, str], float] = {}
+        # 用户ID -> (计算时间（monotonic）, 全部服务使用统计)，本进程计数或重置时作废
+        self._stats_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
         
         # 使用限制配置
         self.limits = {
@@ -37,89 +74,176 @@ class UsageTracker:
                 "minute": -1
             }
         }
+        self._compile_limits()
+    
+    def _compile_limits(self):
+        """把limits预编译成 服务 -> (每日限额, 每分钟限额, 每日不限量, 每分钟不限量) 的元组表"""
+        self._compiled_limits: Dict[str, Tuple[int, int, bool, bool]] = {
+            service: (
+                service_limits["daily"],
+                service_limits["minute"],
+                service_limits["daily"] == -1,
+                service_limits["minute"] == -1
+            )
+            for service, service_limits in self.limits.items()
+        }
+    
+    def _now_buckets(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """返回当前（或给定时间戳now）的(日期桶, 分钟桶)
+
+        日期桶按本地时区计算，与原先按本地日期字符串划分一致；
+        同一分钟内复用已算好的日期桶，避免每次调用都做时区换算。
+        """
+        now = int(time.time() if now is None else now)
+        minute = now // 60
+        if minute != self._bucket_minute:
+            self._bucket_minute = minute
+            self._bucket_day = (now + time.localtime(now).tm_gmtoff) // 86400
+        return self._bucket_day, minute
+    
+    def _minute_counters(self, minute: int) -> Dict[Tuple[int, int, str], int]:
+        """返回分钟桶minute所在的可写槽位，槽位还属于更早的分钟时先清空再占用"""
+        idx = minute & 1
+        if self._slot_minutes[idx] < minute:
+            self._minute_slots[idx].clear()
+            self._slot_minutes[idx] = minute
+        return self._minute_slots[idx]
+    
+    def _minute_count(self, minute: int, user_id: int, service: str) -> int:
+        """读取某分钟的计数；槽位已被后来的分钟占用时键不存在，结果为0"""
+        return self._minute_slots[minute & 1].get((minute, user_id, service), 0)
+    
+    # 以下三个方法是计数的存储原语，RedisUsageTracker覆盖它们换成Redis存储
+    async def _add_counts(self, user_id: int, service: str, count: int, day: int, minute: int) -> Tuple[int, int, int]:
+        """增加计数，返回增加后的(当日计数, 当前分钟计数, 上一分钟计数)"""
+        # 增加每日使用量
+        daily_key = (day, user_id, service)
+        daily_usage = self.daily_usage.get(daily_key, 0) + count
+        self.daily_usage[daily_key] = daily_usage
+        
+        # 增加每分钟使用量
+        minute_counters = self._minute_counters(minute)
+        minute_key = (minute, user_id, service)
+        minute_usage = minute_counters.get(minute_key, 0) + count
+        minute_counters[minute_key] = minute_usage
+        
+        return daily_usage, minute_usage, self._minute_count(minute - 1, user_id, service)
+    
+    async def _read_counts(self, user_id: int, service: str, day: int, minute: int) -> Tuple[int, int, int]:
+        """读取(当日计数, 当前分钟计数, 上一分钟计数)"""
+        return (
+            self.daily_usage.get((day, user_id, service), 0),
+            self._minute_count(minute, user_id, service),
+            self._minute_count(minute - 1, user_id, service)
+        )
+    
+    async def _delete_counts(self, user_id: int, service: str, day: int, minute: int):
+        """删除当日、当前分钟和上一分钟的计数（滑动窗口估算会用到上一分钟）"""
+        self.daily_usage.pop((day, user_id, service), None)
+        for bucket in (minute, minute - 1):
+            self._minute_slots[bucket & 1].pop((bucket, user_id, service), None)
     
     async def increment_usage(self, user_id: int, service: str, count: int = 1):
         """增加使用计数"""
-        try:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
-            
-            # 增加每日使用量
-            self.daily_usage[current_date][f"{user_id}_{service}"] += count
-            
-            # 增加每分钟使用量
-            self.minute_usage[current_minute][f"{user_id}_{service}"] += count
-            
-            # 定期清理过期数据
-            await self._cleanup_expired_data()
-            
-            logger.debug(f"用户 {user_id} 服务 {service} 使用量 +{count}")
-            
-        except Exception as e:
-            logger.error(f"记录使用量失败: {e}")
+        current_date, current_minute = self._now_buckets()
+        
+        daily_usage, minute_usage, previous = await self._add_counts(user_id, service, count, current_date, current_minute)
+        self._stats_cache.pop(user_id, None)
+        
+        # 接近限额时作废缓存的允许判定，让后续检查重新计算
+        if (user_id, service) in self._decision_cache:
+            self._invalidate_if_near_limit(user_id, service, daily_usage, minute_usage + previous)
+        
+        logger.debug(f"用户 {user_id} 服务 {service} 使用量 +{count}")
     
     async def get_daily_usage(self, user_id: int, service: str) -> int:
         """获取每日使用量"""
-        try:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            key = f"{user_id}_{service}"
-            return self.daily_usage[current_date].get(key, 0)
-        except Exception as e:
-            logger.error(f"获取每日使用量失败: {e}")
-            return 0
+        return (await self.get_usage_pair(user_id, service))[0]
     
     async def get_minute_usage(self, user_id: int, service: str) -> int:
         """获取每分钟使用量"""
-        try:
-            current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
-            key = f"{user_id}_{service}"
-            return self.minute_usage[current_minute].get(key, 0)
-        except Exception as e:
-            logger.error(f"获取每分钟使用量失败: {e}")
-            return 0
+        return (await self.get_usage_pair(user_id, service))[1]
+    
+    async def get_usage_pair(self, user_id: int, service: str, sliding: bool = False) -> Tuple[int, float]:
+        """只取一次时间戳，同时返回(每日使用量, 每分钟使用量)
+
+        sliding为True时每分钟使用量取滑动窗口估算值：按当前分钟已过去的比例，
+        把上一分钟的计数线性折算进来，避免固定窗口在分钟边界前后各用满一次额度造成的2倍突发。
+        """
+        now = time.time()
+        current_date, current_minute = self._now_buckets(now)
+        
+        daily_usage, minute_usage, previous = await self._read_counts(user_id, service, current_date, current_minute)
+        if sliding:
+            elapsed = (now % 60) / 60
+            minute_usage = previous * (1 - elapsed) + minute_usage
+        return daily_usage, minute_usage
+    
+    async def get_sliding_minute_usage(self, user_id: int, service: str) -> float:
+        """获取滑动窗口内最近60秒的估算使用量"""
+        return (await self.get_usage_pair(user_id, service, sliding=True))[1]
+    
+    @staticmethod
+    def _near_limit(usage: float, limit: int) -> bool:
+        """有限额且用量已达到限额的90%"""
+        return limit > 0 and usage >= limit * NEAR_LIMIT_RATIO
+    
+    def _invalidate_if_near_limit(self, user_id: int, service: str, daily_usage: float, minute_usage: float):
+        """用量接近任一限额时移除缓存的允许判定"""
+        daily_limit, minute_limit, _, _ = self._compiled_limits.get(service, _UNLIMITED)
+        if self._near_limit(daily_usage, daily_limit) or self._near_limit(minute_usage, minute_limit):
+            self._decision_cache.pop((user_id, service), None)
     
     async def check_limit(self, user_id: int, service: str) -> Dict[str, bool]:
         """检查是否超出限制"""
-        try:
-            service_limits = self.limits.get(service, {"daily": -1, "minute": -1})
-            
-            daily_usage = await self.get_daily_usage(user_id, service)
-            minute_usage = await self.get_minute_usage(user_id, service)
-            
-            daily_ok = service_limits["daily"] == -1 or daily_usage < service_limits["daily"]
-            minute_ok = service_limits["minute"] == -1 or minute_usage < service_limits["minute"]
-            
-            return {
-                "daily_ok": daily_ok,
-                "minute_ok": minute_ok,
-                "can_proceed": daily_ok and minute_ok
-            }
-            
-        except Exception as e:
-            logger.error(f"检查限制失败: {e}")
+        # 最近已判定为允许且未过期，直接返回
+        cache_key = (user_id, service)
+        now = time.monotonic()
+        expires_at = self._decision_cache.get(cache_key)
+        if expires_at is not None and expires_at > now:
             return {"daily_ok": True, "minute_ok": True, "can_proceed": True}
+        
+        daily_limit, minute_limit, daily_unlimited, minute_unlimited = self._compiled_limits.get(service, _UNLIMITED)
+        
+        daily_usage, minute_usage = await self.get_usage_pair(user_id, service, sliding=True)
+        
+        daily_ok = daily_unlimited or daily_usage < daily_limit
+        minute_ok = minute_unlimited or minute_usage < minute_limit
+        
+        if self.cache_decisions and daily_ok and minute_ok and not (
+            self._near_limit(daily_usage, daily_limit)
+            or self._near_limit(minute_usage, minute_limit)
+        ):
+            self._decision_cache[cache_key] = now + DECISION_CACHE_TTL
+        else:
+            self._decision_cache.pop(cache_key, None)
+        
+        return {
+            "daily_ok": daily_ok,
+            "minute_ok": minute_ok,
+            "can_proceed": daily_ok and minute_ok
+        }
     
     async def get_usage_stats(self, user_id: int, service: str) -> Dict[str, Any]:
         """获取使用统计"""
         try:
-            service_limits = self.limits.get(service, {"daily": -1, "minute": -1})
+            daily_limit, minute_limit, daily_unlimited, minute_unlimited = self._compiled_limits.get(service, _UNLIMITED)
             
-            daily_usage = await self.get_daily_usage(user_id, service)
-            minute_usage = await self.get_minute_usage(user_id, service)
+            daily_usage, minute_usage = await self.get_usage_pair(user_id, service)
             
             return {
                 "service": service,
                 "daily": {
                     "used": daily_usage,
-                    "limit": service_limits["daily"],
-                    "remaining": max(0, service_limits["daily"] - daily_usage) if service_limits["daily"] != -1 else -1,
-                    "percentage": (daily_usage / service_limits["daily"] * 100) if service_limits["daily"] > 0 else 0
+                    "limit": daily_limit,
+                    "remaining": -1 if daily_unlimited else max(0, daily_limit - daily_usage),
+                    "percentage": (daily_usage / daily_limit * 100) if daily_limit > 0 else 0
                 },
                 "minute": {
                     "used": minute_usage,
-                    "limit": service_limits["minute"],
-                    "remaining": max(0, service_limits["minute"] - minute_usage) if service_limits["minute"] != -1 else -1,
-                    "percentage": (minute_usage / service_limits["minute"] * 100) if service_limits["minute"] > 0 else 0
+                    "limit": minute_limit,
+                    "remaining": -1 if minute_unlimited else max(0, minute_limit - minute_usage),
+                    "percentage": (minute_usage / minute_limit * 100) if minute_limit > 0 else 0
                 }
             }
             
@@ -132,59 +256,52 @@ class UsageTracker:
             }
     
     async def get_all_usage_stats(self, user_id: int) -> Dict[str, Any]:
-        """获取所有服务的使用统计"""
+        """获取所有服务的使用统计（结果缓存STATS_CACHE_TTL秒）"""
         try:
+            now = time.monotonic()
+            cached = self._stats_cache.get(user_id)
+            if cached is not None and now - cached[0] < STATS_CACHE_TTL:
+                # 返回浅拷贝，调用方会在顶层追加字段
+                return dict(cached[1])
+            
             stats = {}
             for service in self.limits.keys():
                 stats[service] = await self.get_usage_stats(user_id, service)
             
             # 计算总体统计
-            total_requests = sum([
-                stats[service]["daily"]["used"] 
-                for service in stats 
-                if stats[service]["daily"]["used"] > 0
-            ])
+            total_requests = sum(service_stats["daily"]["used"] for service_stats in stats.values())
             
-            return {
+            result = {
                 "user_id": user_id,
                 "timestamp": datetime.now().isoformat(),
                 "total_requests_today": total_requests,
                 "services": stats
             }
+            self._stats_cache[user_id] = (now, result)
+            return dict(result)
             
         except Exception as e:
             logger.error(f"获取全部使用统计失败: {e}")
             return {"user_id": user_id, "services": {}}
     
-    async def _cleanup_expired_data(self):
-        """清理过期数据"""
+    def cleanup_expired_data(self):
+        """清理过期的每日数据（每分钟数据由槽位轮换自动覆盖）"""
         try:
-            current_time = datetime.now()
+            current_date, _ = self._now_buckets()
             
-            # 每小时清理一次
-            if current_time - self.last_cleanup < timedelta(hours=1):
+            # 清理超过7天的每日数据；截止日每天才前进一次，其余时候直接返回
+            cutoff_date = current_date - 7
+            if cutoff_date <= self._daily_floor:
                 return
             
-            # 清理超过7天的每日数据
-            cutoff_date = (current_time - timedelta(days=7)).strftime("%Y-%m-%d")
-            expired_dates = [
-                date for date in self.daily_usage.keys() 
-                if date < cutoff_date
-            ]
-            for date in expired_dates:
-                del self.daily_usage[date]
-            
-            # 清理超过1小时的每分钟数据
-            cutoff_minute = (current_time - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
-            expired_minutes = [
-                minute for minute in self.minute_usage.keys() 
-                if minute < cutoff_minute
-            ]
-            for minute in expired_minutes:
-                del self.minute_usage[minute]
-            
-            self.last_cleanup = current_time
-            logger.debug(f"清理过期数据: {len(expired_dates)}天, {len(expired_minutes)}分钟")
+            # 一次遍历重建只含未过期记录的新表再整体替换，比逐个del快且不留空槽；
+            # 重建在事件循环线程内一次完成，期间不会有计数写入
+            kept = {key: value for key, value in self.daily_usage.items() if key[0] >= cutoff_date}
+            expired_count = len(self.daily_usage) - len(kept)
+            self.daily_usage = kept
+            self._daily_floor = cutoff_date
+            
+            logger.debug(f"清理过期数据: 每日记录{expired_count}条")
             
         except Exception as e:
             logger.error(f"清理过期数据失败: {e}")
@@ -192,22 +309,21 @@ class UsageTracker:
     async def reset_user_usage(self, user_id: int, service: str):
         """重置用户使用量（管理员功能）"""
         try:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            current_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
-            
-            key = f"{user_id}_{service}"
+            current_date, current_minute = self._now_buckets()
             
-            if key in self.daily_usage[current_date]:
-                del self.daily_usage[current_date][key]
-            
-            if key in self.minute_usage[current_minute]:
-                del self.minute_usage[current_minute][key]
+            await self._delete_counts(user_id, service, current_date, current_minute)
+            self._decision_cache.pop((user_id, service), None)
+            self._stats_cache.pop(user_id, None)
             
             logger.info(f"重置用户 {user_id} 服务 {service} 使用量")
             
         except Exception as e:
             logger.error(f"重置使用量失败: {e}")
     
+    async def aclose(self):
+        """释放存储占用的连接（内存存储无需释放）"""
+        return
+    
     def update_limits(self, service: str, daily_limit: int = None, minute_limit: int = None):
         """更新服务限制"""
         try:
@@ -220,10 +336,90 @@ class UsageTracker:
             if minute_limit is not None:
                 self.limits[service]["minute"] = minute_limit
             
+            # 限额变化后重建元组表，旧的判定也不再可信
+            self._compile_limits()
+            self._decision_cache.clear()
+            self._stats_cache.clear()
+            
             logger.info(f"更新服务 {service} 限制: 每日{daily_limit}, 每分钟{minute_limit}")
             
         except Exception as e:
             logger.error(f"更新限制失败: {e}")
 
-# 全局实例
-usage_tracker = UsageTracker() 
\ No newline at end of file
+class RedisUsageTracker(UsageTracker):
+    """
+    基于Redis的使用量追踪器
+    
+    多个worker进程共享同一份计数，不会各自记一份；每次计数用一次管道往返完成，
+    过期数据由键上的EXPIRE自动删除。每个时间桶一个哈希（usage:d:{日期桶} / usage:m:{分钟桶}），
+    字段为 {用户ID}:{服务}，比每个用户一个顶层键省内存。使用异步客户端并设置较短超时，
+    等待Redis时不阻塞事件循环；Redis不可用时记录错误并把计数当作0，即按未超限放行。
+    
+    不缓存允许判定：其他worker的计数无法作废本进程缓存的判定，缓存会让限额被多个进程叠加超出。
+    """
+    
+    cache_decisions = False
+    
+    def __init__(self, url: str):
+        super().__init__()
+        self.redis = aioredis.Redis.from_url(
+            url,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT
+        )
+    
+    async def _add_counts(self, user_id: int, service: str, count: int, day: int, minute: int) -> Tuple[int, int, int]:
+        field = f"{user_id}:{service}"
+        day_key = f"usage:d:{day}"
+        minute_key = f"usage:m:{minute}"
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(day_key, field, count)
+        pipe.expire(day_key, REDIS_DAILY_TTL)
+        pipe.hincrby(minute_key, field, count)
+        pipe.expire(minute_key, REDIS_MINUTE_TTL)
+        pipe.hget(f"usage:m:{minute - 1}", field)
+        try:
+            daily_usage, _, minute_usage, _, previous = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"记录使用量失败: {e}")
+            return 0, 0, 0
+        return daily_usage, minute_usage, int(previous or 0)
+    
+    async def _read_counts(self, user_id: int, service: str, day: int, minute: int) -> Tuple[int, int, int]:
+        field = f"{user_id}:{service}"
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(f"usage:d:{day}", field)
+        pipe.hget(f"usage:m:{minute}", field)
+        pipe.hget(f"usage:m:{minute - 1}", field)
+        try:
+            values = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"获取使用量失败: {e}")
+            return 0, 0, 0
+        return tuple(int(value or 0) for value in values)
+    
+    async def _delete_counts(self, user_id: int, service: str, day: int, minute: int):
+        field = f"{user_id}:{service}"
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(f"usage:d:{day}", field)
+        pipe.hdel(f"usage:m:{minute}", field)
+        pipe.hdel(f"usage:m:{minute - 1}", field)
+        try:
+            await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"重置使用量失败: {e}")
+    
+    def cleanup_expired_data(self):
+        """过期计数由Redis的EXPIRE删除，无需扫描"""
+        return
+    
+    async def aclose(self):
+        """断开Redis连接池"""
+        await self.redis.connection_pool.disconnect()
+
+# 全局实例：配置了REDIS_URL时使用Redis存储，否则使用进程内存
+REDIS_URL = os.getenv("REDIS_URL")
+usage_tracker = RedisUsageTracker(REDIS_URL) if REDIS_URL else UsageTracker() 
\ No newline at end of file
@@ -19,43 +19,74 @@
 最后更新: 2025年1月
 """
 
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 from dotenv import load_dotenv
 import os
+import logging
 
-from app.database import engine, Base
+from app.database import init_db
 from app.routers import users, skills, learning, jobs, agent
 from app.core.config import settings
+from app.core.cors import PermissiveCORSMiddleware
+from app.services.leetcode_service import LeetCodeService
+from app.services.ollama_client import OllamaClient
+from app.services.usage_tracker import usage_tracker, CLEANUP_INTERVAL
 
 # 加载环境变量配置文件
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+async def usage_cleanup_loop():
+    """
+    后台定时清理使用量追踪器中的过期数据
+    
+    清理不再放在每次记录使用量的热路径上，而是每隔CLEANUP_INTERVAL秒执行一次
+    """
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL)
+        usage_tracker.cleanup_expired_data()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     应用生命周期管理器
     
     负责管理FastAPI应用的启动和关闭过程：
-    - 启动时：创建数据库表结构
-    - 关闭时：清理资源（如数据库连接、缓存等）
+    - 启动时：按需创建数据库表结构（表结构哈希未变化时跳过），启动使用量定时清理任务
+    - 关闭时：清理资源（如定时任务、共享HTTP会话、数据库连接等）
     
     Args:
         app: FastAPI应用实例
     """
     # 启动时创建数据库表
     print("🚀 正在初始化数据库...")
-    Base.metadata.create_all(bind=engine)
-    print("✅ 数据库初始化完成")
+    if init_db():
+        print("✅ 数据库初始化完成")
+    else:
+        print("✅ 表结构未变化，跳过建表")
+    
+    app.state.cleanup_task = asyncio.create_task(usage_cleanup_loop())
     
     yield
     
     # 关闭时清理资源
     print("🔄 正在清理应用资源...")
-    # 这里可以添加清理逻辑，如关闭数据库连接池、清理缓存等
+    # 停止使用量定时清理任务
+    app.state.cleanup_task.cancel()
+    try:
+        await app.state.cleanup_task
+    except asyncio.CancelledError:
+        pass
+    # 关闭共享的HTTP会话
+    await LeetCodeService.aclose()
+    await OllamaClient.aclose()
+    await usage_tracker.aclose()
     print("✅ 资源清理完成")
 
 # 创建FastAPI应用实例
@@ -85,14 +116,20 @@ app = FastAPI(
 )
 
 # 配置跨域资源共享(CORS)中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 允许所有域名访问（生产环境应限制具体域名）
-    allow_credentials=True,  # 允许携带认证信息
-    allow_methods=["*"],  # 允许所有HTTP方法
-    allow_headers=["*"],  # 允许所有请求头
-    expose_headers=["*"]  # 暴露所有响应头
-)
+# 允许所有域名、HTTP方法和请求头并允许携带认证信息（生产环境应限制具体域名），
+# 响应头预先编码，不走逐项匹配策略的通用CORSMiddleware
+app.add_middleware(PermissiveCORSMiddleware)
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """
+    未捕获异常的统一处理
+    
+    使用量追踪等热路径方法不再各自包一层try/except，意外异常在这里统一记录日志，
+    并返回与HTTPException一致的JSON错误格式
+    """
+    logger.exception(f"处理请求 {request.method} {request.url.path} 时发生未捕获异常: {exc}")
+    return JSONResponse(status_code=500, content={"detail": "服务器内部错误"})
 
 # 注册API路由模块
 # 每个模块负责特定的业务功能
@@ -139,14 +176,25 @@ async def health_check():
 # 应用启动入口
 if __name__ == "__main__":
     """
-    开发环境启动配置
+    启动配置
     
-    生产环境建议使用 gunicorn 或 uvicorn 作为WSGI服务器
+    开发环境：单进程，代码变更时自动重载
+    生产环境（ENVIRONMENT=production）：关闭重载，使用uvloop事件循环和httptools解析器，
+    按WORKERS环境变量（默认CPU核数）启动多个worker进程；
+    多进程时应同时设置REDIS_URL，否则各进程的使用量计数互不相通
     """
+    is_production = settings.ENVIRONMENT == "production"
+    workers = int(os.getenv("WORKERS", os.cpu_count() or 1)) if is_production else None
+    if is_production and workers > 1 and not os.getenv("REDIS_URL"):
+        print("⚠️ 多个worker进程未配置REDIS_URL，使用量限额将按进程分别统计")
+    
     print("🚀 启动程序员求职加速器Agent API服务...")
     uvicorn.run(
         app="main:app",
         host="0.0.0.0",  # 监听所有网络接口
         port=8000,       # 监听端口
-        reload=True      # 开发模式，代码变更时自动重载
+        reload=not is_production,  # 开发模式，代码变更时自动重载
+        loop="uvloop" if is_production else "auto",      # C实现的事件循环
+        http="httptools" if is_production else "auto",   # C实现的HTTP解析器
+        workers=workers
     )